@@ -0,0 +1,98 @@
+import hashlib
+import mmap
+import os
+import struct
+from os import path
+import pygame
+from pygame import freetype
+
+# fonts and images are loaded once here and shared by the map, character and interpreter.
+# scaled images are also saved to CACHE_DIR as raw pixels, so later launches can memory-map them
+# instead of decoding and scaling the pngs again
+CACHE_DIR = path.join(".", ".asset_cache")
+# header of a cached image: <source mtime (ns)>, <source size>, <width>, <height>
+CACHE_HEADER = struct.Struct("<qqii")
+
+fonts = {}
+# (<file path>, <size>) -> surface
+images = {}
+# memory maps have to stay open for as long as the surfaces made from them are used
+cache_maps = []
+
+
+def init():
+    # only initialize pygame once, however many modules need it
+    if not pygame.get_init():
+        pygame.init()
+
+
+def font(file_name):
+    # there is one font object per file, so render with size = ... if it needs a different size
+    if file_name not in fonts:
+        init()
+        fonts[file_name] = pygame.freetype.Font(path.join(".", "fonts", file_name))
+    return fonts[file_name]
+
+
+def image(file_path, size = None):
+    # the surface is shared, so it shouldn't be drawn on
+    if (file_path, size) not in images:
+        init()
+        images[(file_path, size)] = _load_image(file_path, size)
+    return images[(file_path, size)]
+
+
+def _load_image(file_path, size):
+    source_stat = os.stat(file_path)
+    cache_path = path.join(CACHE_DIR, hashlib.sha1(repr((file_path, size)).encode()).hexdigest())
+
+    surface = _read_cache(cache_path, source_stat)
+    if surface is None:
+        surface = pygame.image.load(file_path)
+        if size is not None:
+            surface = pygame.transform.scale(surface, size)
+        # store everything as 32 bit with alpha, which keeps colorkey transparency from paletted pngs
+        converted = pygame.Surface(surface.get_size(), pygame.SRCALPHA)
+        converted.blit(surface, (0, 0))
+        surface = converted
+        _write_cache(cache_path, source_stat, surface)
+
+    # match the display's pixel format when there is one, so blitting doesn't have to convert every frame
+    if pygame.display.get_surface() is not None:
+        surface = surface.convert_alpha()
+    return surface
+
+
+def _read_cache(cache_path, source_stat):
+    # returns None if there is no cached copy or the source image has changed since it was made
+    try:
+        with open(cache_path, "rb") as cache_file:
+            cache_map = mmap.mmap(cache_file.fileno(), 0, access = mmap.ACCESS_COPY)
+    except (OSError, ValueError):
+        return None
+
+    if len(cache_map) < CACHE_HEADER.size:
+        cache_map.close()
+        return None
+    mtime, file_size, width, height = CACHE_HEADER.unpack_from(cache_map)
+    if mtime != source_stat.st_mtime_ns or file_size != source_stat.st_size or \
+            len(cache_map) != CACHE_HEADER.size + width * height * 4:
+        cache_map.close()
+        return None
+
+    cache_maps.append(cache_map)
+    return pygame.image.frombuffer(memoryview(cache_map)[CACHE_HEADER.size:], (width, height), "RGBA")
+
+
+def _write_cache(cache_path, source_stat, surface):
+    # the cache is only a speedup, so failing to write it (e.g. read only install) is ignored
+    width, height = surface.get_size()
+    try:
+        os.makedirs(CACHE_DIR, exist_ok = True)
+        temp_path = cache_path + ".tmp"
+        with open(temp_path, "wb") as cache_file:
+            cache_file.write(CACHE_HEADER.pack(source_stat.st_mtime_ns, source_stat.st_size, width, height))
+            cache_file.write(pygame.image.tostring(surface, "RGBA"))
+        os.replace(temp_path, cache_path)
+    except OSError:
+        pass
@@ -0,0 +1,336 @@
+import sys
+import numpy
+from character import Character, JUMP_FRAMES
+from map import Map
+from program import compile_program, Executor
+
+# runs many programs on the same map at once. The positions, velocities, flags, hitbox queues and targets left of
+# every run are kept in numpy arrays, and each tick does the same physics, collisions and target breaking as
+# Character._tick for all of them with array operations. Only reading the programs' inputs is done per run
+# (and only for runs that aren't waiting). Every run gives exactly the same win_frames as simulation.Simulation
+
+# input from a program as a number, 0 for no input
+ACTIONS = {None: 0, "": 0, "jump": 1, "endjump": 2, "left": 3, "right": 4, "stop": 5,
+           "atk_left": 6, "atk_right": 7, "atk_up": 8}
+# hitboxes in the hitbox queues. Each slot holds every hitbox due on that frame as bits, 0 for no hitbox
+HITBOX_UP = 1
+HITBOX_RIGHT = 2
+HITBOX_LEFT = 4
+# longest wait kept in BatchSimulation.wait_left, the rest of a longer one stays in the run's executor
+MAX_WAIT = numpy.iinfo(numpy.int64).max
+# slots in each hitbox queue. Character.push_hitbox puts a hitbox at most 7 * 3 + 1 slots in
+QUEUE_LENGTH = 24
+
+
+class BatchSimulation:
+    def __init__(self, map_name, programs):
+        self.map = Map(map_name, headless = True)
+        # only used for the spawn position and size
+        self.character = Character(self.map, headless = True)
+        self.programs = list(programs)
+        self.count = len(self.programs)
+
+        # floor tiles summed over every rectangle from the top left of the map, so checking whether a rect touches
+        # a floor tile takes four lookups. The floor never changes, only targets do
+        height, width = self.map.start_render_map.shape
+        self.floor_sums = numpy.zeros((height + 1, width + 1), dtype = numpy.int32)
+        self.floor_sums[1:, 1:] = (self.map.start_render_map == 1).cumsum(0).cumsum(1)
+
+        targets = sorted(self.map.all_targets)
+        self.target_x = numpy.array([x for x, y in targets], dtype = numpy.int64)
+        self.target_y = numpy.array([y for x, y in targets], dtype = numpy.int64)
+
+        # programs are compiled once however many runs share them
+        self.compiled = {}
+        for code in self.programs:
+            if code not in self.compiled:
+                self.compiled[code] = compile_program(code)
+
+        self.reset()
+
+    def reset(self):
+        # every run starts from the spawnpoint, like pressing play in the editor
+        self.character.spawn()
+        count = self.count
+        self.x = numpy.full(count, float(self.character.pos[0]))
+        self.y = numpy.full(count, float(self.character.pos[1]))
+        self.velocity_x = numpy.zeros(count)
+        self.velocity_y = numpy.zeros(count)
+        # never equal to a velocity, like Character.old_velocity before the first tick
+        self.old_velocity_x = numpy.full(count, numpy.nan)
+        self.old_velocity_y = numpy.full(count, numpy.nan)
+        self.grounded = numpy.ones(count, dtype = bool)
+        self.collided = numpy.zeros(count, dtype = bool)
+        self.facing_left = numpy.zeros(count, dtype = bool)
+
+        # each hitbox queue is a ring buffer starting at queue_start
+        self.hitbox_queue = numpy.zeros((count, QUEUE_LENGTH), dtype = numpy.int8)
+        self.queue_start = numpy.zeros(count, dtype = numpy.int64)
+        self.queue_length = numpy.zeros(count, dtype = numpy.int64)
+        # frame each run's last jump leaves the ground on (see Character's scheduler). JUMP waits for it, so a run
+        # never has more than one coming
+        self.endjump_frame = numpy.full(count, -1, dtype = numpy.int64)
+
+        # whether each target is still there, for every run
+        self.targets = numpy.ones((count, len(self.target_x)), dtype = bool)
+        self.done = numpy.zeros(count, dtype = bool)
+        self.win_frames = numpy.zeros(count, dtype = numpy.int64)
+        self.total_frame = 0
+
+        self.executors = [Executor(self.compiled[code]) for code in self.programs]
+        # frames each run's program still waits for. Waits are taken out of the executors and counted here, so
+        # waiting runs don't need a call into their executor every frame
+        self.wait_left = numpy.zeros(count, dtype = numpy.int64)
+        # runs whose program hasn't finished
+        self.running = numpy.ones(count, dtype = bool)
+
+    def step(self):
+        # like Character.step, the frame the last target broke on is recorded on the next frame
+        self.win_frames[self.done & (self.win_frames == 0)] = self.total_frame
+
+        actions = self._next_actions()
+        self._act(actions)
+        self._move()
+        self._hit()
+        self.total_frame += 1
+
+    def run(self, max_frames):
+        # returns the win_frames of every run, 0 for runs that didn't break every target within max_frames.
+        # stops early once no run can break another target: every run has either won, or finished its program with
+        # no attack still to come out
+        while self.total_frame < max_frames and (~self.done & (self.running | (self.wait_left > 0) |
+                                                               (self.queue_length > 0))).any():
+            self.step()
+        self.win_frames[self.done & (self.win_frames == 0)] = self.total_frame
+        return self.win_frames
+
+    def _next_actions(self):
+        actions = numpy.zeros(self.count, dtype = numpy.int8)
+        # the end of a jump is an input of its own, on a frame the program is waiting
+        actions[(self.endjump_frame == self.total_frame) & ~self.done] = ACTIONS["endjump"]
+        waiting = self.wait_left > 0
+        self.wait_left[waiting] -= 1
+        # programs stop once every target is broken
+        for index in numpy.flatnonzero(~waiting & self.running & ~self.done):
+            executor = self.executors[index]
+            action = executor.next_action()
+            if action is None:
+                self.running[index] = False
+            elif executor.wait_left > 0:
+                # waits can be any size. A wait too long for the array is counted down here in parts, with the
+                # executor giving the rest back (a frame less) once this part runs out
+                wait = min(executor.wait_left, MAX_WAIT)
+                self.wait_left[index] = wait
+                executor.wait_left -= wait
+            actions[index] = ACTIONS[action]
+        return actions
+
+    def _act(self, actions):
+        self.endjump_frame[actions == ACTIONS["jump"]] = self.total_frame + JUMP_FRAMES
+        self.velocity_y[(actions == ACTIONS["endjump"]) & self.grounded] = -1.8
+
+        left = actions == ACTIONS["left"]
+        self.velocity_x[left] = -2
+        self.facing_left[left] = True
+        right = actions == ACTIONS["right"]
+        self.velocity_x[right] = 2
+        self.facing_left[right] = False
+        self.velocity_x[actions == ACTIONS["stop"]] = 0
+
+        # attacking backwards comes out sooner than attacking forwards
+        attack_left = actions == ACTIONS["atk_left"]
+        attack_right = actions == ACTIONS["atk_right"]
+        self._push_hitbox(numpy.flatnonzero(attack_left & ~self.facing_left), HITBOX_LEFT, 3)
+        self._push_hitbox(numpy.flatnonzero(attack_left & self.facing_left), HITBOX_LEFT, 7)
+        self._push_hitbox(numpy.flatnonzero(attack_right & ~self.facing_left), HITBOX_RIGHT, 7)
+        self._push_hitbox(numpy.flatnonzero(attack_right & self.facing_left), HITBOX_RIGHT, 3)
+        self._push_hitbox(numpy.flatnonzero(actions == ACTIONS["atk_up"]), HITBOX_UP, 7)
+
+    def _push_hitbox(self, runs, hitbox, frame):
+        # same as Character.push_hitbox: a queue shorter than the slot is padded with no hitbox and the hitbox goes
+        # after the padding, otherwise it's added to whatever is in the slot
+        if len(runs) == 0:
+            return
+        frame = frame * 3
+        start = self.queue_start[runs]
+        length = self.queue_length[runs]
+        pad = length <= frame
+
+        padded = runs[pad]
+        if len(padded) > 0:
+            # position of each slot in the queue
+            positions = (numpy.arange(QUEUE_LENGTH) - start[pad][:, None]) % QUEUE_LENGTH
+            queues = self.hitbox_queue[padded]
+            queues[(positions >= length[pad][:, None]) & (positions <= frame)] = 0
+            queues[numpy.arange(len(padded)), (start[pad] + frame + 1) % QUEUE_LENGTH] = hitbox
+            self.hitbox_queue[padded] = queues
+            self.queue_length[padded] = frame + 2
+
+        replaced = runs[~pad]
+        self.hitbox_queue[replaced, (start[~pad] + frame) % QUEUE_LENGTH] |= hitbox
+
+    def _move(self):
+        # calculate physics
+        falling = ~self.grounded
+        self.velocity_y[falling] += 0.05
+        self.velocity_y[self.grounded & (self.velocity_y > 0)] = 0
+
+        unchanged = (self.velocity_x == self.old_velocity_x) & (self.velocity_y == self.old_velocity_y)
+        self.old_velocity_x = self.velocity_x.copy()
+        self.old_velocity_y = self.velocity_y.copy()
+
+        # runs still pushed into the wall they were stopped by last frame don't move
+        runs = numpy.flatnonzero(~self.collided | ~unchanged)
+        if len(runs) == 0:
+            return
+        x = self.x[runs]
+        y = self.y[runs]
+        velocity_x = self.velocity_x[runs]
+        velocity_y = self.velocity_y[runs]
+        new_x = x + velocity_x
+        new_y = y + velocity_y
+
+        # if there is an intersection, attempt to circumvent block by not going up or down
+        intersect = self._blocked(new_x, new_y, *self.character.size)
+        for sliding, step in ((intersect & (velocity_y < 0), 0.05), (intersect & (velocity_y > 0), -0.05)):
+            new_y[sliding], intersect[sliding] = self._slide_back(y[sliding], new_y[sliding], new_x[sliding], 1, step)
+
+        # then attempt to not go forwards
+        new_y[intersect] = y[intersect] + velocity_y[intersect]
+        for sliding, step in ((intersect & (velocity_x > 0), -0.05), (intersect & (velocity_x < 0), 0.05)):
+            new_x[sliding], intersect[sliding] = self._slide_back(x[sliding], new_x[sliding], new_y[sliding], 0, step)
+
+        # otherwise don't move
+        moved = ~intersect
+        runs = runs[moved]
+        new_x = new_x[moved]
+        new_y = new_y[moved]
+        self.collided[runs] = False
+        self.grounded[runs] = self._blocked(new_x, new_y + 2, *self.character.size)
+        rounded_x = _round2(new_x)
+        rounded_y = _round2(new_y)
+        self.collided[runs] = (_round2(x[moved]) == rounded_x) & (_round2(y[moved]) == rounded_y)
+        self.x[runs] = rounded_x
+        self.y[runs] = rounded_y
+
+    def _slide_back(self, old, new, other, axis, step):
+        # Character._slide_back for many runs: moves new back towards old in steps until it stops intersecting.
+        # other is the position on the other axis. Returns (<new>, <whether each still intersects>)
+        if len(new) == 0:
+            return new, numpy.zeros(0, dtype = bool)
+        direction = 1 if step > 0 else -1
+        clear, found = self._first_clear(new, other, axis, direction, old + direction)
+
+        # every position new goes through, one column per step. add.accumulate adds one step at a time, so the
+        # positions are exactly the ones repeatedly adding step gives
+        steps = int(numpy.abs(new - old).max() / abs(step)) + 2
+        positions = numpy.full((len(new), steps + 1), step)
+        positions[:, 0] = new
+        numpy.add.accumulate(positions, axis = 1, out = positions)
+
+        intersect = ~found[:, None] | ((clear[:, None] - numpy.trunc(positions)) * direction > 0)
+        intersect[:, 0] = True
+        # the loop stops at the first position that is clear or past old
+        stopped = ~intersect | ((positions - old[:, None]) * direction > 0)
+        last = stopped.argmax(axis = 1)
+        runs = numpy.arange(len(new))
+        return positions[runs, last], intersect[runs, last]
+
+    def _first_clear(self, pos, other, axis, direction, limit):
+        # Map.first_clear for many runs, checking every whole pixel up to limit at once.
+        # returns (<first clear coordinate>, <whether one was found before passing limit>)
+        start = numpy.trunc(pos).astype(numpy.int64)
+        # whole pixels from start to limit, one column each
+        distance = numpy.floor((limit - start) * direction).astype(numpy.int64)
+        coords = start[:, None] + numpy.arange(max(int(distance.max()) + 1, 1)) * direction
+        others = numpy.broadcast_to(other[:, None], coords.shape)
+        if axis == 0:
+            blocked = self._blocked(coords, others, *self.character.size)
+        else:
+            blocked = self._blocked(others, coords, *self.character.size)
+        clear = ~blocked & (numpy.arange(coords.shape[1]) <= distance[:, None])
+        first = clear.argmax(axis = 1)
+        runs = numpy.arange(len(pos))
+        return coords[runs, first], clear[runs, first]
+
+    def _tile_range(self, x, y, width, height):
+        # Map.tile_range for many rects, as arrays of tile index ranges (x_start, x_end, y_start, y_end)
+        left = numpy.trunc(x).astype(numpy.int64) - self.map.render_offset[0]
+        top = numpy.trunc(y).astype(numpy.int64) - self.map.render_offset[1]
+        map_width, map_height = self.map.total_map_size
+        x_start = numpy.minimum(numpy.maximum(left // self.map.pixel_size[0], 0), map_width)
+        x_end = numpy.maximum(numpy.minimum((left + width - 1) // self.map.pixel_size[0] + 1, map_width), x_start)
+        y_start = numpy.minimum(numpy.maximum(top // self.map.pixel_size[1], 0), map_height)
+        y_end = numpy.maximum(numpy.minimum((top + height - 1) // self.map.pixel_size[1] + 1, map_height), y_start)
+        return x_start, x_end, y_start, y_end
+
+    def _blocked(self, x, y, width, height):
+        # whether each rect overlaps a floor tile
+        x_start, x_end, y_start, y_end = self._tile_range(x, y, width, height)
+        sums = self.floor_sums
+        return sums[y_end, x_end] - sums[y_start, x_end] - sums[y_end, x_start] + sums[y_start, x_start] > 0
+
+    def _hit(self):
+        attack_length = 10
+        attack_width = 10
+        runs = numpy.flatnonzero(self.queue_length > 0)
+        if len(runs) == 0:
+            return
+        hitboxes = self.hitbox_queue[runs, self.queue_start[runs]]
+        self.queue_start[runs] = (self.queue_start[runs] + 1) % QUEUE_LENGTH
+        self.queue_length[runs] -= 1
+
+        # same hitboxes as Character._tick (up, right and left are all attack_width x attack_length here), every
+        # one due this frame
+        size = self.character.size
+        for hitbox in (HITBOX_UP, HITBOX_RIGHT, HITBOX_LEFT):
+            attacking = runs[hitboxes & hitbox != 0]
+            if len(attacking) == 0:
+                continue
+            x = self.x[attacking]
+            y = self.y[attacking]
+            if hitbox == HITBOX_UP:
+                hitbox_x = x + (size[0] - attack_width) / 2
+                hitbox_y = y - attack_length
+            else:
+                hitbox_x = x + size[0] if hitbox == HITBOX_RIGHT else x - attack_length
+                hitbox_y = y - (attack_width - size[1]) / 2
+            x_start, x_end, y_start, y_end = self._tile_range(hitbox_x, hitbox_y, attack_length, attack_width)
+
+            # break every target the hitbox touches
+            hits = self.targets[attacking] & \
+                (self.target_x >= x_start[:, None]) & (self.target_x < x_end[:, None]) & \
+                (self.target_y >= y_start[:, None]) & (self.target_y < y_end[:, None])
+            broke = hits.any(1)
+            attacking = attacking[broke]
+            self.targets[attacking] &= ~hits[broke]
+            # end the run when all targets are gone
+            self.done[attacking] = ~self.targets[attacking].any(1)
+
+
+def _round2(values):
+    # round(value, 2) for every value. numpy rounds value * 100, which can come out on the other side of a half
+    # than Python's exact rounding, so values that close to a half are rounded by Python instead
+    scaled = values * 100
+    result = numpy.rint(scaled) / 100
+    for index in numpy.flatnonzero(numpy.abs(scaled - numpy.floor(scaled) - 0.5) < 1e-6):
+        result[index] = round(float(values[index]), 2)
+    return result
+
+
+if __name__ == "__main__":
+    # usage: python batch.py <map> <program file> [<program file> ...] [--frames <max frames>]
+    # prints the win_frames of each program (0 if it didn't break every target)
+    arguments = sys.argv[2:]
+    max_frames = 30 * 60 * 10
+    if "--frames" in arguments:
+        index = arguments.index("--frames")
+        max_frames = int(arguments[index + 1])
+        del arguments[index:index + 2]
+    programs = []
+    for file_path in arguments:
+        with open(file_path, "r") as program_file:
+            programs.append(program_file.read().strip("\n"))
+    win_frames = BatchSimulation(sys.argv[1], programs).run(max_frames)
+    for file_path, frames in zip(arguments, win_frames):
+        print(file_path + ":", frames)
@@ -0,0 +1,183 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+# benchmarks run without a window
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+from batch import BatchSimulation
+from character import Character
+from interpreter import Interpreter
+from map import Map
+from program import compile_program
+from simulation import Simulation
+
+MAPS = ["flat", "long", "map"]
+
+# programs that keep the character moving, jumping and attacking so collisions and hitboxes are exercised
+PROGRAMS = {
+    "run_and_jump": "\n".join(["MOVE RIGHT", "JUMP", "WAIT 20", "ATTACK UP", "MOVE LEFT", "JUMP", "WAIT 25",
+                               "ATTACK LEFT"] * 50),
+    "wall_push": "\n".join(["MOVE LEFT", "WAIT 200", "MOVE RIGHT", "WAIT 200"] * 10),
+    "attack_spam": "\n".join(["ATTACK RIGHT", "WAIT 2", "ATTACK UP", "WAIT 2", "MOVE RIGHT", "ATTACK LEFT"] * 100)
+}
+
+
+def _time(function, repeats):
+    # median seconds per call over a few repeats, after one warm up call
+    function()
+    timings = []
+    for repeat in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def bench_ticks(map_name, code, frames, repeats):
+    # Character._tick through the headless simulation
+    def run():
+        simulation = Simulation(map_name, code)
+        for frame in range(frames):
+            simulation.step()
+    return {"value": frames / _time(run, repeats), "unit": "ticks/s"}
+
+
+def bench_batch(map_name, runs, frames, repeats):
+    # ticks of every run per second through batch.BatchSimulation, using the same programs as bench_ticks
+    programs = [list(PROGRAMS.values())[index % len(PROGRAMS)] for index in range(runs)]
+
+    def run():
+        simulation = BatchSimulation(map_name, programs)
+        for frame in range(frames):
+            simulation.step()
+    return {"value": runs * frames / _time(run, repeats), "unit": "ticks/s"}
+
+
+def bench_block_intersect(map_name, queries, repeats):
+    # cost of one collision query, placed around the whole map
+    simulation = Simulation(map_name, "")
+    character = simulation.character
+    map = simulation.map
+    positions = []
+    for index in range(queries):
+        positions.append([map.render_offset[0] + (index * 37) % (map.total_map_size[0] * map.pixel_size[0]),
+                          map.render_offset[1] + (index * 53) % (map.total_map_size[1] * map.pixel_size[1])])
+
+    def run():
+        for pos in positions:
+            character._block_intersect(pos, character.size)
+    return {"value": _time(run, repeats) / queries * 1e9, "unit": "ns/query"}
+
+
+def bench_map_render(map_name, frames, repeats, full = True):
+    # full draws the whole view every frame, otherwise nothing changes between frames so only the check for what
+    # changed is timed
+    screen = pygame.Surface((1440, 768))
+    map = Map(map_name)
+
+    def run():
+        for frame in range(frames):
+            if full:
+                map._redraw_all()
+            map._render(screen)
+    return {"value": _time(run, repeats) / frames * 1e3, "unit": "ms/frame"}
+
+
+def bench_map_scroll(map_name, frames, repeats):
+    # drawing while the view scrolls across a map larger than it, a pixel a frame
+    screen = pygame.Surface((1440, 768))
+    map = Map(map_name)
+
+    def run():
+        for frame in range(frames):
+            map.follow((map.render_offset[0] + frame, map.render_offset[1]), (0, 0))
+            map._render(screen)
+    return {"value": _time(run, repeats) / frames * 1e3, "unit": "ms/frame"}
+
+
+def bench_interpreter_render(lines, frames, repeats, full = True):
+    # full draws everything every frame (the text layer with every line too, like after editing a line), like
+    # bench_map_render
+    screen = pygame.Surface((1440, 768))
+    map = Map("flat")
+    interpreter = Interpreter(map, Character(map))
+    interpreter.code = "\n".join(["MOVE RIGHT", "WAIT 10", "JUMP", "ATTACK UP"] * (lines // 4))
+
+    def run():
+        for frame in range(frames):
+            if full:
+                interpreter.drawn = None
+                interpreter.text_layer_lines = []
+                interpreter.text_layer_columns = 0
+            interpreter._render(screen)
+    return {"value": _time(run, repeats) / frames * 1e3, "unit": "ms/frame"}
+
+
+def bench_compile(lines, repeats):
+    code = "\n".join(["MOVE RIGHT", "WAIT 1000", "JUMP", "ATTACK UP", "REPEAT 10", "MOVE LEFT", "END"] * (lines // 7))
+    return {"value": _time(lambda: compile_program(code), repeats) * 1e3, "unit": "ms"}
+
+
+def run_benchmarks(repeats):
+    results = {}
+    for map_name in MAPS:
+        for program_name, code in PROGRAMS.items():
+            results["tick/" + map_name + "/" + program_name] = bench_ticks(map_name, code, 3000, repeats)
+        results["batch/" + map_name + "/1000_runs"] = bench_batch(map_name, 1000, 1000, repeats)
+        results["block_intersect/" + map_name] = bench_block_intersect(map_name, 20000, repeats)
+        results["map_render/" + map_name] = bench_map_render(map_name, 200, repeats)
+        results["map_render_unchanged/" + map_name] = bench_map_render(map_name, 200, repeats, full = False)
+    results["map_scroll/marathon"] = bench_map_scroll("marathon", 2000, repeats)
+    for lines in (10, 200):
+        results["interpreter_render/" + str(lines) + "_lines"] = bench_interpreter_render(lines, 200, repeats)
+        results["interpreter_render_unchanged/" + str(lines) + "_lines"] = \
+            bench_interpreter_render(lines, 200, repeats, full = False)
+    for lines in (1000, 100000):
+        results["compile/" + str(lines) + "_lines"] = bench_compile(lines, repeats)
+    return results
+
+
+def compare(old_results, new_results):
+    # ms and ns are better when lower, ticks/s when higher
+    for name, new in new_results.items():
+        if name not in old_results:
+            continue
+        old = old_results[name]
+        change = (new["value"] - old["value"]) / old["value"] * 100
+        faster = change > 0 if new["unit"] == "ticks/s" else change < 0
+        print("{:45} {:>12.3f} -> {:>12.3f} {:9} {:+7.1f}% {}".format(name, old["value"], new["value"], new["unit"],
+                                                                     change, "better" if faster else "worse"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "benchmark simulation, rendering and parsing")
+    parser.add_argument("--output", help = "write results to this JSON file (default: print them)")
+    parser.add_argument("--compare", help = "JSON file from an earlier run to compare against")
+    parser.add_argument("--repeats", type = int, default = 5)
+    args = parser.parse_args()
+
+    report = {
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "platform": platform.platform(),
+        "time": time.time(),
+        "results": run_benchmarks(args.repeats)
+    }
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent = 2)
+    else:
+        json.dump(report, sys.stdout, indent = 2)
+        print()
+
+    if args.compare:
+        with open(args.compare, "r") as compare_file:
+            compare(json.load(compare_file)["results"], report["results"])
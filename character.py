@@ -1,14 +1,24 @@
 import pygame
 from os import path
-from pygame import freetype
+import assets
+from scheduler import Scheduler
+
+# animation frames are loaded once and shared by every Character, keyed by (<dir>, <size>, <frames>)
+loaded_anims = {}
+
+# frames from a jump input until the character leaves the ground (program.py makes JUMP wait for it)
+JUMP_FRAMES = 13
 
 
 class Character:
-    def __init__(self, map):
+    def __init__(self, map, headless = False):
         self.show_hitbox = False
         self.show_hurtbox = False
 
-        pygame.init()
+        # headless characters only simulate: no fonts or images are loaded, and run() can't be used
+        self.headless = headless
+        if not self.headless:
+            assets.init()
 
         self.map = map
         # character is calculated using the top left corner as (0,0), following pygame standards
@@ -17,8 +27,8 @@ class Character:
 
         self.grounded = True
 
-        # list of inputs per frame that is read frame by frame and executed
-        self.framedata = []
+        # program.Executor that gives the input for each frame, None when there is no program to run
+        self.program = None
 
         self.facing = "right"
 
@@ -27,7 +37,11 @@ class Character:
         # animate once every 3 frames (except jumpsquat, which needs to be animated every frame)
         self.anim_counter = 0
 
-        self.hitbox_queue = []
+        # hitboxes and the ends of jumps still to come, by the frame they happen on
+        self.scheduler = Scheduler()
+        # (pos, size) of the hitbox checked in the last tick (the last one if there were several), drawn by run()
+        # when show_hitbox is on
+        self.last_hitbox = None
 
         self.blocking_anim = False
         # velocity per frame (30fps)
@@ -40,15 +54,21 @@ class Character:
 
         self.total_frame = 0
 
-        self.font = pygame.freetype.Font(path.join(".", "fonts", "Menlo.ttc"))
-        self.font.size = 12
-        self.font.fgcolor = (156, 170, 255)
+        if not self.headless:
+            self.font = assets.font("Menlo.ttc")
+            self.font.size = 12
+            self.font.fgcolor = (156, 170, 255)
+
+        # what run() last drew: (<sprite surface>, <sprite rect>, <hurtbox rect>, <hitbox rect>) and
+        # (<frame counter text>, <rect>), so only what changes is drawn again
+        self.drawn = None
+        self.drawn_counter = None
 
-        # initialize animations ((<x_offset>, <y_offset>),[<surface>])
+        # initialize animations ((<x_offset>, <y_offset>),[(<surface facing right>, <surface facing left>)])
         # x_offset and y_offset are relative to the top left corner of the character (the hitbox is 14x28)
-        # all animations are facing right. Animations are flipped in self._render()
+        # the images all face right, the flipped frames are made when loading (see self._load_atlas())
         self.anim_idle = self._load_char_anim((-8, 0), path.join(".", "images", "char", "idle"), (32, 32), frames = 4)
-        self.anim_aerial = [(-8, 0), pygame.transform.scale(pygame.image.load(path.join(".", "images", "char", "idle", "0.png")), (32, 32))]
+        self.anim_aerial = self._load_char_anim((-8, 0), path.join(".", "images", "char", "idle"), (32, 32), frames = 1)
         self.anim_jump = self._load_char_anim((-8, 0), path.join(".", "images", "char", "jump"), (32, 32), frames = 6)
         self.anim_walk = self._load_char_anim((-8, 0), path.join(".", "images", "char", "walk"), (32, 32), frames = 7)
         self.anim_ftilt = self._load_char_anim((-8, 0), path.join(".", "images", "char", "ftilt"), (32, 32), frames = 12)
@@ -58,20 +78,43 @@ class Character:
 
     def _load_char_anim(self, offset, dir, size, frames = 1):
         anim_list = [offset]
+        if self.headless:
+            # keep the frame count so the animation queue still behaves the same
+            return anim_list + [None] * frames
+        if (dir, size, frames) not in loaded_anims:
+            loaded_anims[(dir, size, frames)] = self._load_atlas(dir, size, frames)
+        return anim_list + loaded_anims[(dir, size, frames)]
+
+    def _load_atlas(self, dir, size, frames):
+        # every frame of an animation goes on one surface, facing right on the top row and flipped below it.
+        # frames are subsurfaces of it, so drawing a frame in either direction is a single blit
+        atlas = pygame.Surface((size[0] * frames, size[1] * 2), pygame.SRCALPHA)
         for frame in range(frames):
-            anim_list.append(pygame.transform.scale(pygame.image.load(path.join(dir, str(frame)+".png")), size))
-        return anim_list
+            image = assets.image(path.join(dir, str(frame)+".png"), size)
+            atlas.blit(image, (frame * size[0], 0))
+            atlas.blit(pygame.transform.flip(image, True, False), (frame * size[0], size[1]))
+
+        return [(atlas.subsurface(pygame.Rect(frame * size[0], 0, size[0], size[1])),
+                 atlas.subsurface(pygame.Rect(frame * size[0], size[1], size[0], size[1])))
+                for frame in range(frames)]
+
+    def run(self, screen, dirty = ()):
+        # only draws, the game loop runs step() separately (see timestep.py)
+        # dirty are the rects of the screen already drawn on this frame, the character is drawn again wherever they
+        # overlap it. Returns the rects of the screen that were drawn on
+        return self._render(screen, dirty)
 
-    def run(self, screen):
-        self.screen = screen
+    def step(self):
         # run one frame or freeze if game is frozen
         # freeze game if game has ended
         if self.map.done:
-            self.framedata = []
+            self.program = None
             if self.map.win_frames == 0:
                 self.map.win_frames = self.total_frame
 
-        self._render(screen)
+        # animations move on with the game rather than with drawing, so they keep up when frames aren't drawn
+        if not self.headless:
+            self._advance_animation()
         self._tick()
         self.total_frame += 1
 
@@ -82,9 +125,10 @@ class Character:
                     self.map.render_offset[1] - self.size[1]]
 
         self.grounded = True
-        self.framedata = []
+        self.program = None
         self.anim_stack = []
-        self.hitbox_queue = []
+        self.scheduler.clear()
+        self.last_hitbox = None
         self.blocking_anim = False
         self.velocity = [0,0]
         self.facing = "right"
@@ -94,7 +138,78 @@ class Character:
 
 
 
-    def _render(self, screen):
+    def snapshot(self):
+        # everything about the character that changes as the game runs (see checkpoints.py), to give to restore()
+        old_velocity = self.old_velocity[:] if type(self.old_velocity) == list else self.old_velocity
+        program = None if self.program is None else (self.program, self.program.snapshot())
+        return (self.pos[:], self.velocity[:], old_velocity, self.grounded, self.facing, self.collided,
+                self.velocity_unchanged, self.total_frame, self.anim_stack[:], self.anim_counter, self.blocking_anim,
+                self.scheduler.snapshot(), self.last_hitbox, program)
+
+    def restore(self, state):
+        (pos, velocity, old_velocity, self.grounded, self.facing, self.collided, self.velocity_unchanged,
+         self.total_frame, anim_stack, self.anim_counter, self.blocking_anim, scheduled, self.last_hitbox,
+         program) = state
+        # snapshots are copied back out, so the same snapshot can be restored again later
+        self.pos = pos[:]
+        self.velocity = velocity[:]
+        self.old_velocity = old_velocity[:] if type(old_velocity) == list else old_velocity
+        self.anim_stack = anim_stack[:]
+        self.scheduler.restore(scheduled)
+        self.program = None
+        if program is not None:
+            self.program = program[0]
+            self.program.restore(program[1])
+
+    def _render(self, screen, dirty = ()):
+        self._idle_animation()
+        dirty = list(dirty)
+        rects = []
+
+        frame, offset = self.anim_stack[0]
+        surface = frame[1] if self.facing == "left" else frame[0]
+        # drawn where the map's view has scrolled to
+        sprite_rect = surface.get_rect(topleft = self.map.to_screen((self.pos[0] + offset[0],
+                                                                     self.pos[1] + offset[1],
+                                                                     self.size[0], self.size[1])).topleft)
+        hurtbox_rect = self.map.to_screen((self.pos[0], self.pos[1], self.size[0], self.size[1])) \
+            if self.show_hurtbox else None
+        hitbox_rect = None
+        if self.show_hitbox and self.last_hitbox is not None:
+            hitbox_pos, hitbox_size = self.last_hitbox
+            hitbox_rect = self.map.to_screen((hitbox_pos[0], hitbox_pos[1], hitbox_size[0], hitbox_size[1]))
+
+        # the sprite and debugging boxes are only drawn again when they change or something was drawn over them
+        drawn = (surface, sprite_rect, hurtbox_rect, hitbox_rect)
+        old_rects = [rect for rect in (self.drawn or ())[1:] if rect is not None]
+        if drawn != self.drawn or any(rect.collidelist(dirty) != -1 for rect in old_rects):
+            # clear the old ones off the map first
+            for rect in old_rects:
+                rects.append(self.map.redraw(screen, rect))
+
+            # debugging hurtbox display
+            if hurtbox_rect is not None:
+                debug_box = pygame.Surface(self.size)
+                debug_box.fill((255, 0, 0))
+                rects.append(screen.blit(debug_box, hurtbox_rect))
+
+            rects.append(screen.blit(surface, sprite_rect))
+            if hitbox_rect is not None:
+                rects.append(self._render_hitbox(screen, hitbox_rect))
+            self.drawn = drawn
+
+        # frame counter, drawn on the editor's plain border in the top left corner
+        counter = str(self.total_frame)
+        if self.drawn_counter is None or self.drawn_counter[0] != counter or \
+                self.drawn_counter[1].collidelist(dirty) != -1:
+            if self.drawn_counter is not None:
+                screen.fill((8, 0, 26), self.drawn_counter[1])
+                rects.append(self.drawn_counter[1])
+            self.drawn_counter = (counter, screen.blit(*self.font.render(counter)))
+            rects.append(self.drawn_counter[1])
+        return rects
+
+    def _idle_animation(self):
         # idle if nothing is happening
         if len(self.anim_stack) == 0:
             self.blocking_anim = False
@@ -107,31 +222,22 @@ class Character:
                 # when in the air
                 self.push_animation(self.anim_aerial)
 
-        # debugging hurtbox display
-        if self.show_hurtbox:
-            debug_box = pygame.Surface(self.size)
-            debug_box.fill((255, 0, 0))
-            screen.blit(debug_box, pygame.Rect(self.pos[0], self.pos[1], self.size[0], self.size[1]))
-
-        if self.facing == "left":
-            screen.blit(pygame.transform.flip(self.anim_stack[0][0], True, False),
-                        pygame.Rect(self.pos[0] + self.anim_stack[0][1][0],
-                                    self.pos[1] + self.anim_stack[0][1][1],
-                                    self.size[0], self.size[1]))
-        else:
-            screen.blit(self.anim_stack[0][0],
-                        pygame.Rect(self.pos[0] + self.anim_stack[0][1][0],
-                                    self.pos[1] + self.anim_stack[0][1][1],
-                                    self.size[0], self.size[1]))
-
+    def _advance_animation(self):
+        # each animation frame is shown for 3 ticks
+        self._idle_animation()
         if self.anim_counter < 2:
             self.anim_counter += 1
         else:
             self.anim_stack.pop(0)
             self.anim_counter = 0
 
-        # frame counter
-        screen.blit(*self.font.render(str(self.total_frame)))
+    def _render_hitbox(self, screen, hitbox_rect):
+        # debugging hitbox display, returns the rect drawn on
+        hitbox_pos, hitbox_size = self.last_hitbox
+        print(hitbox_pos, hitbox_size)
+        hitbox_surface = pygame.Surface(hitbox_size)
+        hitbox_surface.fill((0, 255, 0))
+        return screen.blit(hitbox_surface, hitbox_rect)
 
     def push_animation(self, anim_list, block_flag = False, facing = None):
         if facing != None:
@@ -148,57 +254,63 @@ class Character:
                 self.anim_stack.append((anim, offset))
 
     def push_hitbox(self, direction, frame):
-        frame = frame * 3
-        if len(self.hitbox_queue) <= frame:
-            while len(self.hitbox_queue) <= frame:
-                self.hitbox_queue.append("")
-            self.hitbox_queue.append(direction)
-        else:
-            self.hitbox_queue[frame] = direction
+        # the hitbox comes out frame * 3 frames from now, or one frame later if no other hitbox is due by then
+        # (attacks have always come out like this, so changing it would change how long programs take).
+        # Any number of hitboxes can be due on the same frame, and they all come out
+        frame = self.total_frame + frame * 3
+        last = self.scheduler.last("hitbox")
+        if last is None or last < frame:
+            frame += 1
+        self.scheduler.schedule(frame, "hitbox", direction)
 
 
     def _tick(self):
+        # events due this frame. The end of a jump is only an input while there's a program running
+        hitboxes = []
+        for kind, value in self.scheduler.due(self.total_frame):
+            if kind == "endjump" and self.program is not None and self.grounded:
+                self.velocity[1] = -1.8
+            elif kind == "hitbox":
+                hitboxes.append(value)
+
         # action to do in current frame
-        if len(self.framedata) > 0:
-            # print(self.framedata[0])
-            if self.framedata[0] == "jump":
+        action = self.program.next_action() if self.program is not None else None
+        if action is not None:
+            # print(action)
+            if action == "jump":
                 if self.grounded:
                     self.push_animation(self.anim_jump, block_flag = True)
-            elif self.framedata[0] == "endjump":
-                if self.grounded:
-                    self.velocity[1] = -1.8
-            elif self.framedata[0] == "left":
+                self.scheduler.schedule(self.total_frame + JUMP_FRAMES, "endjump")
+            elif action == "left":
                 self.velocity[0] = -2
                 self.facing = "left"
                 if self.grounded:
                     self.push_animation(self.anim_walk, facing = "left")
-            elif self.framedata[0] == "right":
+            elif action == "right":
                 self.velocity[0] = 2
                 self.facing = "right"
                 if self.grounded:
                     self.push_animation(self.anim_walk, facing = "right")
-            elif self.framedata[0] == "stop":
+            elif action == "stop":
                 self.velocity[0] = 0
-            elif self.framedata[0] == "atk_left":
+            elif action == "atk_left":
                 if self.facing == "right":
                     self.push_hitbox("left",3)
                     self.push_animation(self.anim_btilt, facing = "right")
                 elif self.facing == "left":
                     self.push_hitbox("left",7)
                     self.push_animation(self.anim_ftilt, facing = "left")
-            elif self.framedata[0] == "atk_right":
+            elif action == "atk_right":
                 if self.facing == "right":
                     self.push_hitbox("right",7)
                     self.push_animation(self.anim_ftilt, facing = "right")
                 elif self.facing == "left":
                     self.push_hitbox("right",3)
                     self.push_animation(self.anim_btilt, facing = "left")
-            elif self.framedata[0] == "atk_up":
+            elif action == "atk_up":
                 self.push_hitbox("up",7)
                 self.push_animation(self.anim_utilt)
 
-            self.framedata.pop(0)
-
 
 
         # calculate physics
@@ -224,25 +336,17 @@ class Character:
             # if there is an intersection, attempt to circumvent block by not going up or down
             if intersect:
                 if self.velocity[1] < 0:
-                    while new_pos[1] <= self.pos[1] and intersect:
-                        new_pos[1] += 0.05
-                        intersect = self._block_intersect(new_pos, self.size)
+                    intersect = self._slide_back(new_pos, 1, 0.05)
                 elif self.velocity[1] > 0:
-                    while new_pos[1] >= self.pos[1] and intersect:
-                        new_pos[1] -= 0.05
-                        intersect = self._block_intersect(new_pos, self.size)
+                    intersect = self._slide_back(new_pos, 1, -0.05)
 
             # then attempt to not go forwards
             if intersect:
                 new_pos[1] = self.pos[1] + self.velocity[1]
                 if self.velocity[0] > 0:
-                    while new_pos[0] >= self.pos[0] and intersect:
-                        new_pos[0] -= 0.05
-                        intersect = self._block_intersect(new_pos, self.size)
+                    intersect = self._slide_back(new_pos, 0, -0.05)
                 elif self.velocity[0] < 0:
-                    while new_pos[0] <= self.pos[0] and intersect:
-                        new_pos[0] += 0.05
-                        intersect = self._block_intersect(new_pos, self.size)
+                    intersect = self._slide_back(new_pos, 0, 0.05)
 
             # otherwise don't move.
             if not intersect:
@@ -260,64 +364,39 @@ class Character:
         # hitboxes
         attack_length = 10
         attack_width = 10
-        if len(self.hitbox_queue) > 0:
-            if self.hitbox_queue[0] == "up":
+        self.last_hitbox = None
+        for hitbox in hitboxes:
+            if hitbox == "up":
                 hitbox_pos = [self.pos[0] + (self.size[0] - attack_width) / 2, self.pos[1] - attack_length]
                 hitbox_size = [attack_width, attack_length]
 
-                self._block_intersect(hitbox_pos, hitbox_size, block_type = 2)
-
-                # render hitbox
-                if self.show_hitbox:
-                    print(hitbox_pos, hitbox_size)
-                    hitbox_surface = pygame.Surface(hitbox_size)
-                    hitbox_surface.fill((0, 255, 0))
-                    self.screen.blit(hitbox_surface,pygame.Rect(hitbox_pos[0], hitbox_pos[1], hitbox_size[0], hitbox_size[1]))
-
-            elif self.hitbox_queue[0] == "right":
+            elif hitbox == "right":
                 hitbox_pos = [self.pos[0] + self.size[0], self.pos[1] - (attack_width - self.size[1]) / 2]
                 hitbox_size = [attack_length, attack_width]
 
-                self._block_intersect(hitbox_pos, hitbox_size, block_type = 2)
-
-                # render hitbox
-                if self.show_hitbox:
-                    print(hitbox_pos, hitbox_size)
-                    hitbox_surface = pygame.Surface(hitbox_size)
-                    hitbox_surface.fill((0, 255, 0))
-                    self.screen.blit(hitbox_surface,pygame.Rect(hitbox_pos[0], hitbox_pos[1], hitbox_size[0], hitbox_size[1]))
-
-            elif self.hitbox_queue[0] == "left":
+            elif hitbox == "left":
                 hitbox_pos = [self.pos[0] - attack_length, self.pos[1] - (attack_width - self.size[1]) / 2]
                 hitbox_size = [attack_length, attack_width]
 
-                self._block_intersect(hitbox_pos, hitbox_size, block_type = 2)
+            self._block_intersect(hitbox_pos, hitbox_size, block_type = 2)
+            self.last_hitbox = (hitbox_pos, hitbox_size)
 
-                # render hitbox
-                if self.show_hitbox:
-                    print(hitbox_pos, hitbox_size)
-                    hitbox_surface = pygame.Surface(hitbox_size)
-                    hitbox_surface.fill((0, 255, 0))
-                    self.screen.blit(hitbox_surface,pygame.Rect(hitbox_pos[0], hitbox_pos[1], hitbox_size[0], hitbox_size[1]))
-
-
-            self.hitbox_queue.pop(0)
 
+    def _slide_back(self, new_pos, axis, step):
+        # move new_pos back towards self.pos along one axis until it stops intersecting, returns whether it still does
+        # the contact point is solved up front with Map.first_clear, so stepping back doesn't query any tiles.
+        # it still moves in 0.05px steps so positions come out exactly as they always have
+        direction = 1 if step > 0 else -1
+        clear = self.map.first_clear(new_pos, self.size, axis, direction, self.pos[axis] + direction)
+        intersect = True
+        while intersect and (new_pos[axis] - self.pos[axis]) * direction <= 0:
+            new_pos[axis] += step
+            intersect = clear is None or (clear - int(new_pos[axis])) * direction > 0
+        return intersect
 
     def _block_intersect(self, pos, size, block_type = 1):
-        # if block type is 2 break the target
-        player_rect = pygame.Rect(pos[0], pos[1], size[0], size[1])
-        intersect = False
-        for y_index in range(self.map.total_map_size[0]):
-            for x_index in range(self.map.total_map_size[1]):
-                if self.map.render_map[y_index][x_index] == block_type:
-                    block_rect = pygame.Rect((self.map.render_offset[0] + x_index * self.map.pixel_size[0],
-                                              self.map.render_offset[1] + y_index * self.map.pixel_size[1],
-                                              self.map.pixel_size[0],
-                                              self.map.pixel_size[1]))
-                    intersect = player_rect.colliderect(block_rect)
-                    if intersect:
-                        if block_type == 2:
-                            self.map.break_target(x_index, y_index)
-                        return intersect
-        return intersect
+        # if block type is 2 break every target the rect touches
+        # only the tiles under the rect are checked (see Map.tile_range)
+        if block_type == 2:
+            return self.map.break_targets(pos, size) > 0
+        return self.map.find_block(pos, size, block_type) is not None
@@ -0,0 +1,43 @@
+# snapshots of a run taken every INTERVAL frames. Going back to any frame restores the last snapshot before it and
+# runs the frames after it again, so it takes at most INTERVAL - 1 frames however long the run is
+INTERVAL = 30
+
+
+class Checkpoints:
+    def __init__(self, character, interval = INTERVAL):
+        self.character = character
+        self.map = character.map
+        self.interval = interval
+        # snapshot of frame <index> * interval at each index: (<character snapshot>, <map snapshot>)
+        self.snapshots = []
+
+    def clear(self):
+        # call when the run starts again (the character respawns or gets a new program)
+        self.snapshots = []
+
+    def record(self):
+        # takes a snapshot if the current frame is due one and doesn't have it yet. Nothing is taken without a program
+        # (before play and after a win), the game loop keeps stepping then and nothing would change
+        if self.character.program is None:
+            return
+        frame = self.character.total_frame
+        if frame % self.interval == 0 and frame // self.interval == len(self.snapshots):
+            self.snapshots.append((self.character.snapshot(), self.map.snapshot()))
+
+    def step(self):
+        # runs one frame, taking snapshots as it goes. Use this instead of Character.step
+        self.record()
+        self.character.step()
+
+    def seek(self, frame):
+        # go to frame (forwards or backwards). Frames past the last one run are run to get there
+        frame = max(frame, 0)
+        current = self.character.total_frame
+        index = min(frame // self.interval, len(self.snapshots) - 1)
+        # restoring is only needed to go back, or to skip ahead over frames that have been run already
+        if index >= 0 and (frame < current or index * self.interval > current):
+            character_state, map_state = self.snapshots[index]
+            self.character.restore(character_state)
+            self.map.restore(map_state)
+        while self.character.total_frame < frame:
+            self.step()
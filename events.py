@@ -0,0 +1,17 @@
+import pygame
+
+
+class EventPump:
+    # reads the pygame event queue once per frame and hands each event to the handlers registered for its type
+    def __init__(self):
+        self.handlers = {}
+
+    def register(self, event_type, handler):
+        if event_type not in self.handlers:
+            self.handlers[event_type] = []
+        self.handlers[event_type].append(handler)
+
+    def pump(self):
+        for event in pygame.event.get():
+            for handler in self.handlers.get(event.type, ()):
+                handler(event)
@@ -0,0 +1,312 @@
+import argparse
+import multiprocessing
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from os import path
+
+# frames are drawn offscreen
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import numpy
+import pygame
+from character import Character
+from map import Map
+from program import compile_program, Executor
+
+# exports a run of a program as a video, GIF or PNG frames without a window. The program is run once to record
+# what is on screen each frame (where the character is, its animation frame, which targets broke), then the frames
+# are drawn with Map._render and Character._render and encoded by a pool of worker processes, JOB_FRAMES frames
+# per job. Frames are written out in order as jobs finish, and only a few jobs are run ahead of the writing, so
+# memory use doesn't grow with the length of the run
+FRAME_RATE = 30
+JOB_FRAMES = 60
+VIDEO_EXTENSIONS = (".mp4", ".webm", ".mkv", ".mov", ".avi")
+# GIF colour index left for pixels that haven't changed since the last frame, which are drawn transparent
+GIF_TRANSPARENT = 255
+# Character attributes of every animation, so animation frames can be recorded by name
+ANIMATIONS = ["anim_idle", "anim_aerial", "anim_jump", "anim_walk", "anim_ftilt", "anim_btilt", "anim_utilt"]
+
+# each worker keeps one map and character per map name, and draws every job's frames with them
+worker_games = {}
+
+
+def record(map_name, code, max_frames):
+    # runs the program like pressing play in the editor, until the win is recorded or max_frames frames have been
+    # run. Returns the state drawn on each frame, starting with the frame before the first tick:
+    # (<pos>, <facing>, (<animation>, <frame>), <targets broken since the last frame>)
+    map = Map(map_name)
+    character = Character(map)
+    character.spawn()
+    map.reset_map()
+    map.done = False
+    character.program = Executor(compile_program(code))
+
+    # animation frames are shared, so they can be found by identity
+    animation_frames = {}
+    for name in ANIMATIONS:
+        for index, frame in enumerate(getattr(character, name)[1:]):
+            animation_frames[id(frame)] = (name, index)
+
+    frames = []
+    targets = set(map.targets)
+    while True:
+        # like drawing a frame, which starts an idle animation if nothing else is playing
+        character._idle_animation()
+        broken = tuple(sorted(targets - map.targets))
+        targets = set(map.targets)
+        frames.append((tuple(character.pos), character.facing, animation_frames[id(character.anim_stack[0][0])],
+                       broken))
+        if map.win_frames != 0 or character.total_frame >= max_frames:
+            return frames
+        character.step()
+
+
+def frame_palette(map_name, frames):
+    # a palette for GIFs, taken from a few frames spread through the run and the character's animations (which
+    # are too small a part of any frame to get colours of their own). It has every colour index but GIF_TRANSPARENT
+    from PIL import Image
+    map, character = _game(map_name)
+    samples = [pygame.image.frombytes(render(map_name, [frames[index]], index, frame_targets(map_name, frames, index),
+                                             "rgb")[0], map.view_rect.size, "RGB")
+               for index in sorted(set([0, len(frames) // 2, len(frames) - 1]))]
+    # every animation frame, drawn over the background a few times so it counts for as much as a frame
+    sprites = samples[0].copy()
+    sprite_frames = [frame[0] for name in ANIMATIONS for frame in getattr(character, name)[1:]]
+    size = sprite_frames[0].get_size()
+    columns = sprites.get_width() // size[0]
+    for index in range(columns * (sprites.get_height() // size[1])):
+        sprites.blit(sprite_frames[index % len(sprite_frames)],
+                     ((index % columns) * size[0], (index // columns) * size[1]))
+    samples.append(sprites)
+
+    width, height = map.view_rect.size
+    sheet = Image.new("RGB", (width, height * len(samples)))
+    for index, sample in enumerate(samples):
+        sheet.paste(Image.frombytes("RGB", (width, height), pygame.image.tobytes(sample, "RGB")), (0, height * index))
+    # median cut (the default) leaves out small patches of bright colour like hitboxes, an octree doesn't
+    palette = sheet.quantize(GIF_TRANSPARENT, Image.Quantize.FASTOCTREE).getpalette()[:GIF_TRANSPARENT * 3]
+    palette += [0] * (768 - len(palette))
+    return palette
+
+
+def frame_targets(map_name, frames, index):
+    # targets left on frame index
+    targets = set(_game(map_name)[0].all_targets)
+    for frame in frames[:index + 1]:
+        targets.difference_update(frame[3])
+    return targets
+
+
+def _game(map_name):
+    if map_name not in worker_games:
+        map = Map(map_name)
+        worker_games[map_name] = (map, Character(map))
+    return worker_games[map_name]
+
+
+def render(map_name, frames, first_frame, targets, output, palette = None):
+    # draws frames (from record()) starting at frame number first_frame, with targets the targets left on the
+    # first of them. Returns one item per frame depending on output:
+    # "png:<directory>" - None, each frame is saved as <directory>/<frame number>.png
+    # "rgb" - the frame's pixels as RGB bytes
+    # "gif" - the frame encoded as a GIF image block (with palette from frame_palette()), only covering what changed
+    #         since the last frame
+    map, character = _game(map_name)
+    map.restore_targets(targets)
+    # everything is drawn on the first frame, after that only what changes
+    map._redraw_all()
+    character.drawn = None
+    character.drawn_counter = None
+    screen = pygame.Surface(map.view_rect.bottomright)
+    # colour indices of the last GIF frame
+    last_indices = None
+
+    results = []
+    for offset, (pos, facing, (animation, index), broken) in enumerate(frames):
+        if offset > 0:
+            for x, y in broken:
+                map.break_target(x, y)
+        character.pos = list(pos)
+        character.facing = facing
+        animation_frames = getattr(character, animation)
+        character.anim_stack = [(animation_frames[index + 1], animation_frames[0])]
+        character.total_frame = first_frame + offset
+        map.follow(character.pos, character.size)
+
+        dirty = map._render(screen)
+        dirty += character._render(screen, dirty)
+
+        # the frame counter is drawn on a copy, since it isn't part of the map
+        frame = screen.subsurface(map.view_rect).copy()
+        frame.blit(*character.font.render(str(character.total_frame)))
+
+        if output.startswith("png:"):
+            _save_png(frame, path.join(output[4:], "{:06d}.png".format(character.total_frame)))
+            results.append(None)
+        elif output == "rgb":
+            results.append(pygame.image.tobytes(frame, "RGB"))
+        elif output == "gif":
+            indices = _gif_indices(frame, palette)
+            results.append(_gif_block(indices, last_indices, character.total_frame, palette))
+            last_indices = indices
+    return results
+
+
+def _save_png(surface, file_path):
+    # PNGs are written here with each row stored as the difference from the row above and quick compression, which
+    # is several times faster than pygame.image.save for slightly larger files
+    width, height = surface.get_size()
+    pixels = numpy.frombuffer(pygame.image.tobytes(surface, "RGB"), dtype = numpy.uint8).reshape(height, width * 3)
+    # each row starts with its filter type, 2 ("up")
+    rows = numpy.empty((height, width * 3 + 1), dtype = numpy.uint8)
+    rows[:, 0] = 2
+    rows[0, 1:] = pixels[0]
+    numpy.subtract(pixels[1:], pixels[:-1], out = rows[1:, 1:])
+    with open(file_path, "wb") as png_file:
+        png_file.write(b"\x89PNG\r\n\x1a\n")
+        # 8 bit RGB
+        png_file.write(_png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        png_file.write(_png_chunk(b"IDAT", zlib.compress(rows.tobytes(), 1)))
+        png_file.write(_png_chunk(b"IEND", b""))
+
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def _gif_indices(surface, palette):
+    # the colour index of every pixel, as a (height, width) array
+    from PIL import Image
+    palette_image = Image.new("P", (1, 1))
+    palette_image.putpalette(palette)
+    image = Image.frombytes("RGB", surface.get_size(), pygame.image.tobytes(surface, "RGB"))
+    indices = numpy.array(image.quantize(palette = palette_image, dither = 0))
+    # the transparent entry can still be picked for its colour (black), so those pixels get the closest other one
+    colours = numpy.array(palette, int).reshape(-1, 3)
+    closest = numpy.abs(colours[:GIF_TRANSPARENT] - colours[GIF_TRANSPARENT]).sum(1).argmin()
+    indices[indices == GIF_TRANSPARENT] = closest
+    return indices
+
+
+def _gif_block(indices, last_indices, frame_number, palette):
+    from PIL import GifImagePlugin, Image
+    # frames are drawn over the one before (disposal 1), so only the rect around the pixels that changed is
+    # needed, with the unchanged ones in it transparent. Runs of transparent pixels take almost no space
+    position = (0, 0)
+    if last_indices is not None:
+        changed = indices != last_indices
+        rows = numpy.flatnonzero(changed.any(1))
+        columns = numpy.flatnonzero(changed.any(0))
+        if len(rows) == 0:
+            # nothing changed, the smallest image there can be
+            rows = columns = numpy.array([0])
+        position = (int(columns[0]), int(rows[0]))
+        area = (slice(rows[0], rows[-1] + 1), slice(columns[0], columns[-1] + 1))
+        indices = numpy.where(changed[area], indices[area], GIF_TRANSPARENT).astype(numpy.uint8)
+    image = Image.fromarray(indices, "P")
+    image.putpalette(palette)
+    # GIF delays are in hundredths of a second, so they alternate to average out at FRAME_RATE
+    delay = round((frame_number + 1) * 100 / FRAME_RATE) - round(frame_number * 100 / FRAME_RATE)
+    return b"".join(GifImagePlugin.getdata(image, position, duration = delay * 10, disposal = 1,
+                                           transparency = GIF_TRANSPARENT))
+
+
+def _gif_header(size, palette):
+    return (b"GIF89a" + size[0].to_bytes(2, "little") + size[1].to_bytes(2, "little") +
+            # a 256 colour global table, no background colour
+            bytes([0xf7, 0, 0]) + bytes(palette) +
+            # loop forever
+            b"!\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00")
+
+
+def export(map_name, code, output_path, max_frames = 30 * 60 * 10, workers = None, ffmpeg = None):
+    # returns the number of frames exported. The format comes from output_path: a GIF (needs Pillow), a video
+    # (needs ffmpeg) or otherwise a directory of PNG frames
+    frames = record(map_name, code, max_frames)
+    workers = workers or os.cpu_count() or 1
+    extension = path.splitext(output_path)[1].lower()
+
+    palette = None
+    video = None
+    if extension == ".gif":
+        output = "gif"
+        palette = frame_palette(map_name, frames)
+        output_file = open(output_path, "wb")
+        output_file.write(_gif_header(_game(map_name)[0].view_rect.size, palette))
+    elif extension in VIDEO_EXTENSIONS:
+        output = "rgb"
+        ffmpeg = ffmpeg or shutil.which("ffmpeg")
+        if ffmpeg is None:
+            raise ValueError("exporting video needs ffmpeg")
+        width, height = Map(map_name, headless = True).view_rect.size
+        video = subprocess.Popen([ffmpeg, "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24",
+                                  "-s", "{}x{}".format(width, height), "-r", str(FRAME_RATE), "-i", "-",
+                                  "-pix_fmt", "yuv420p", output_path], stdin = subprocess.PIPE)
+        output_file = video.stdin
+    else:
+        output = "png:" + output_path
+        os.makedirs(output_path, exist_ok = True)
+        output_file = None
+
+    jobs = []
+    targets = set(Map(map_name, headless = True).all_targets)
+    for start in range(0, len(frames), JOB_FRAMES):
+        job_frames = frames[start:start + JOB_FRAMES]
+        # with the targets left on the job's first frame
+        targets = targets - set(job_frames[0][3])
+        jobs.append((job_frames, start, targets))
+        for frame in job_frames[1:]:
+            targets = targets - set(frame[3])
+
+    try:
+        # workers are started as new processes, so they don't share pygame's state with this one
+        with ProcessPoolExecutor(workers, mp_context = multiprocessing.get_context("spawn")) as pool:
+            pending = deque()
+            for job_frames, start, job_targets in jobs:
+                pending.append(pool.submit(render, map_name, job_frames, start, job_targets, output, palette))
+                # only a few jobs are run ahead of what has been written
+                if len(pending) >= workers * 2:
+                    _write(pending.popleft().result(), output_file)
+            while len(pending) > 0:
+                _write(pending.popleft().result(), output_file)
+        if output == "gif":
+            output_file.write(b";")
+    finally:
+        if output_file is not None:
+            output_file.close()
+        if video is not None and video.wait() != 0:
+            raise ValueError("ffmpeg failed with exit code " + str(video.returncode))
+    return len(frames)
+
+
+def _write(results, output_file):
+    if output_file is not None:
+        for result in results:
+            output_file.write(result)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "export a run of a program as a video, GIF or PNG frames")
+    parser.add_argument("map")
+    parser.add_argument("program", help = "program file")
+    parser.add_argument("output", help = "a .gif, a video (" + ", ".join(VIDEO_EXTENSIONS) +
+                                         ") or a directory for PNG frames")
+    parser.add_argument("--frames", type = int, default = 30 * 60 * 10, help = "most frames to run")
+    parser.add_argument("--workers", type = int, default = None, help = "worker processes (default: one per core)")
+    parser.add_argument("--ffmpeg", help = "ffmpeg executable (default: the one on PATH)")
+    args = parser.parse_args()
+
+    with open(args.program, "r") as program_file:
+        code = program_file.read().strip("\n")
+    try:
+        print("exported", export(args.map, code, args.output, args.frames, args.workers, args.ffmpeg), "frames")
+    except (ImportError, ValueError) as error:
+        print("export failed:", error)
+        sys.exit(1)
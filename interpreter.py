@@ -1,12 +1,21 @@
 import pygame
 from os import path
-from pygame import freetype
+import assets
 from string import ascii_lowercase
 from string import digits
+from checkpoints import Checkpoints
+from program import Compiler, Executor
+
+# characters typed by each key, looked up by keycode
+KEY_CHARACTERS = {pygame.K_SPACE: " ", pygame.K_RETURN: "\n"}
+for char in ascii_lowercase:
+    KEY_CHARACTERS[getattr(pygame, "K_" + char)] = char.upper()
+for digit in digits:
+    KEY_CHARACTERS[getattr(pygame, "K_" + digit)] = digit
 
 
 class Interpreter:
-    def __init__(self, map, character):
+    def __init__(self, map, character, events = None):
         self.map = map
         self.character = character
 
@@ -15,17 +24,17 @@ class Interpreter:
         self.pressed_play = False
         self.pressed_stop = False
 
-        pygame.init()
+        assets.init()
 
         # import animations
-        self.anim_play = [pygame.image.load(path.join(".", "images", "play", "unpress.png")),
-                          pygame.image.load(path.join(".", "images", "play", "press.png"))]
-        self.anim_stop = [pygame.image.load(path.join(".", "images", "stop", "unpress.png")),
-                          pygame.image.load(path.join(".", "images", "stop", "press.png"))]
+        self.anim_play = [assets.image(path.join(".", "images", "play", "unpress.png")),
+                          assets.image(path.join(".", "images", "play", "press.png"))]
+        self.anim_stop = [assets.image(path.join(".", "images", "stop", "unpress.png")),
+                          assets.image(path.join(".", "images", "stop", "press.png"))]
 
-        self.tps_logo = pygame.transform.scale(pygame.image.load(path.join(".", "images", "tps_logo.png")),(32,32))
+        self.tps_logo = assets.image(path.join(".", "images", "tps_logo.png"), (32, 32))
 
-        self.font = pygame.freetype.Font(path.join(".", "fonts", "Menlo.ttc"))
+        self.font = assets.font("Menlo.ttc")
         self.font.size = 12
         self.font.fgcolor = (156, 170, 255)
 
@@ -35,6 +44,10 @@ class Interpreter:
             'WAIT': self.cmd_wait}
 
         self.error_display = ""
+        # the game loop steps the character through these, so the run can be gone back through
+        self.checkpoints = Checkpoints(self.character)
+        # the code is compiled as it is typed, and errors are shown as soon as they're made
+        self.compiler = Compiler()
 
         self._reset()
 
@@ -44,107 +57,176 @@ class Interpreter:
         self.cursor_display = True
         self.cursor_display_timer = 0
 
+        # keyboard and mouse input comes from an events.EventPump (without one the editor only renders)
+        if events is not None:
+            events.register(pygame.KEYDOWN, self._on_key_down)
+            events.register(pygame.KEYUP, self._on_key_up)
+            events.register(pygame.MOUSEBUTTONDOWN, self._on_mouse_down)
+            events.register(pygame.MOUSEBUTTONUP, self._on_mouse_up)
+
+        # the border, background, logo and title never change, so they are drawn once
+        self.chrome = pygame.Surface((672, 768))
+        self.chrome.fill((8, 0, 26))
+        self.chrome.fill((46, 42, 54), pygame.Rect(36, 72, 600, 660))
+        self.chrome.blit(self.tps_logo, pygame.Rect(36, 16, 32, 32))
+        font_surface, font_rect = self.font.render("Trekking Pole Squad")
+        font_rect = font_rect.move(84, 16)
+        self.chrome.blit(font_surface, font_rect)
+
+        # rendered text is cached and only re-rendered when it changes:
+        # line numbers by number, code lines as (<text>, <surface>, <rect>) by line index
+        self.number_cache = {}
+        self.line_cache = []
+        # the chrome with line numbers and every code line except the last one (the one being typed on)
+        self.text_layer = None
+        self.text_layer_lines = []
+        self.text_layer_columns = 0
+        # (<text>, <surface>, <rect>) of the error message
+        self.error_cache = None
+        # what is on the screen now, so only what changed is drawn: "play" and "stop" (pressed or not),
+        # "line" and "error" ((<text>, <rect>) of the last line and the error message). None before the
+        # first frame, and emptied when everything has to be drawn again
+        self.drawn = None
+        # whether the code was last drawn covered by the map's win screen
+        self.drawn_covered = False
+
 
     def run(self, screen):
+        # returns the rects of the screen that were drawn on
         self._get_input()
-        self._render(screen)
+        return self._render(screen)
 
     def _render(self, screen):
-        # render the border behind the background
-        border = pygame.Surface((672, 768))
-        border.fill((8, 0, 26))
-        screen.blit(border,pygame.Rect(0, 0, 672, 768))
-
-        background = pygame.Surface((600,660))
-        background.fill((46, 42, 54))
-        screen.blit(background,pygame.Rect(36, 72, 600, 660))
-
-        # render buttons
-        if self.pressed_play:
-            screen.blit(self.anim_play[1], pygame.Rect(548, 16, 32, 32))
-        else:
-            screen.blit(self.anim_play[0], pygame.Rect(548, 16, 32, 32))
-
-        if self.pressed_stop:
-            screen.blit(self.anim_stop[1], pygame.Rect(596, 16, 32, 32))
-        else:
-            screen.blit(self.anim_stop[0], pygame.Rect(596, 16, 32, 32))
-
-        screen.blit(self.tps_logo, pygame.Rect(36, 16, 32, 32))
-        font_surface, font_rect = self.font.render("Trekking Pole Squad")
-        font_rect = font_rect.move(84, 16)
-        screen.blit(font_surface, font_rect)
-
+        # only what changed since the last frame is drawn, returns the rects of the screen that were drawn on
+        dirty = []
 
-        # render lines
+        # the border, background and all finished lines come from the text layer
         code_segments = self.code.split("\n")
-        column_count = int((len(code_segments) + 39) / 40)
-        if column_count <= 0:
-            column_count = 1
-
-        column_width = 600 / column_count
-
-        for column_number in range(column_count):
-            for line_number in range(40):
-                font_surface, font_rect = self.font.render(str(line_number + (40 * column_number)))
-                font_rect = font_rect.move(48 + (column_width * column_number), line_number * 16 + 72)
-                screen.blit(font_surface, font_rect)
+        # the code is hidden under the map's win screen when it is shown, so it has to be drawn again after that
+        covered = self.map.done
+        if self._update_text_layer(code_segments) or self.drawn is None or (self.drawn_covered and not covered):
+            screen.blit(self.text_layer, (0, 0))
+            dirty.append(self.text_layer.get_rect())
+            self.drawn = {}
+        self.drawn_covered = covered
 
+        # render buttons
+        if self.drawn.get("play") != self.pressed_play:
+            dirty.append(self._draw_button(screen, self.anim_play[1 if self.pressed_play else 0], (548, 16)))
+            self.drawn["play"] = self.pressed_play
+        if self.drawn.get("stop") != self.pressed_stop:
+            dirty.append(self._draw_button(screen, self.anim_stop[1 if self.pressed_stop else 0], (596, 16)))
+            self.drawn["stop"] = self.pressed_stop
+
+        # the last line is drawn separately because of the cursor
+        last_line = code_segments[-1]
         if self.cursor_display:
-            code_segments[-1] += "|"
+            last_line += "|"
         self.cursor_display_timer += 1
         if self.cursor_display_timer >= 10:
             self.cursor_display_timer = 0
             self.cursor_display = not self.cursor_display
 
-        for segment_index in range(len(code_segments)):
-            font_surface, font_rect = self.font.render(str(code_segments[segment_index]))
-            font_rect = font_rect.move(72 + (int(segment_index / 40) * column_width), (segment_index % 40) * 16 + 72)
-            screen.blit(font_surface, font_rect)
-
+        if not covered and (self.drawn.get("line") is None or self.drawn["line"][0] != last_line):
+            if self.drawn.get("line") is not None:
+                dirty.append(self._restore(screen, self.drawn["line"][1]))
+            font_surface, font_rect = self._render_line(len(code_segments) - 1, last_line)
+            line_rect = self._line_rect(len(code_segments) - 1, font_rect)
+            screen.blit(font_surface, line_rect)
+            dirty.append(line_rect)
+            self.drawn["line"] = (last_line, line_rect)
 
         # render error message
-        self.display_error(screen, update_error = False)
+        if self.drawn.get("error") is None or self.drawn["error"][0] != self.error_display:
+            if self.drawn.get("error") is not None:
+                dirty.append(self._restore(screen, self.drawn["error"][1]))
+            error_rect = self.display_error(screen, update_error = False)
+            dirty.append(error_rect)
+            self.drawn["error"] = (self.error_display, error_rect)
+        return dirty
+
+    def _draw_button(self, screen, image, pos):
+        rect = self._restore(screen, pygame.Rect(pos[0], pos[1], 32, 32))
+        screen.blit(image, rect)
+        return rect
+
+    def _restore(self, screen, rect):
+        # draw the text layer back over rect, to clear what was drawn there
+        rect = pygame.Rect(rect)
+        screen.blit(self.text_layer, rect, rect)
+        return rect
+
+    def _update_text_layer(self, code_segments):
+        column_count = int((len(code_segments) + 39) / 40)
+        if column_count <= 0:
+            column_count = 1
+
+        # returns whether the text layer changed
+        finished_lines = code_segments[:-1]
+        if finished_lines == self.text_layer_lines and column_count == self.text_layer_columns:
+            return False
 
+        # lines were only added after the ones already drawn (the usual case when typing), so draw just those
+        if column_count == self.text_layer_columns and \
+                finished_lines[:len(self.text_layer_lines)] == self.text_layer_lines:
+            first_new_line = len(self.text_layer_lines)
+        else:
+            # otherwise redraw everything, but from cached text where possible
+            self.text_layer = self.chrome.copy()
+            self.text_layer_columns = column_count
+            column_width = 600 / column_count
+            for column_number in range(column_count):
+                for line_number in range(40):
+                    number = line_number + (40 * column_number)
+                    if number not in self.number_cache:
+                        self.number_cache[number] = self.font.render(str(number))
+                    font_surface, font_rect = self.number_cache[number]
+                    font_rect = font_rect.move(48 + (column_width * column_number), line_number * 16 + 72)
+                    self.text_layer.blit(font_surface, font_rect)
+            first_new_line = 0
+
+        for segment_index in range(first_new_line, len(finished_lines)):
+            font_surface, font_rect = self._render_line(segment_index, finished_lines[segment_index])
+            self.text_layer.blit(font_surface, self._line_rect(segment_index, font_rect))
+        self.text_layer_lines = finished_lines
+        return True
+
+    def _render_line(self, segment_index, text):
+        # only render a line again if its text has changed
+        while len(self.line_cache) <= segment_index:
+            self.line_cache.append(None)
+        if self.line_cache[segment_index] is None or self.line_cache[segment_index][0] != text:
+            font_surface, font_rect = self.font.render(text)
+            self.line_cache[segment_index] = (text, font_surface, font_rect)
+        return self.line_cache[segment_index][1], self.line_cache[segment_index][2]
+
+    def _line_rect(self, segment_index, font_rect):
+        column_width = 600 / self.text_layer_columns
+        return font_rect.move(72 + (int(segment_index / 40) * column_width), (segment_index % 40) * 16 + 72)
+
+    def load_map(self, file_name, registry = None):
+        # switch to another map (or reload this one), keeping the code
+        self.map.load(file_name, registry)
+        self._reset()
 
     def _reset(self):
         self.character.spawn()
         self.map.reset_map()
         self.map.done = False
+        self.checkpoints.clear()
+
+    def _compile(self):
+        # only lines changed since the last frame are parsed again, see program.Compiler
+        if not self.compiler.update(self.code):
+            return
+        if len(self.compiler.errors) > 0:
+            line_number, error = self.compiler.errors[0]
+            self.error_display = "Error at line {}: {}".format(line_number, error)
+        else:
+            self.error_display = ""
 
     def _get_input(self):
-        # no mouse input yet for text, only keyboard
-        # backspace and enter and text
-
-        key_down_events = pygame.event.get(eventtype=pygame.KEYDOWN)
-        key_up_events = pygame.event.get(eventtype=pygame.KEYUP)
-
-        for key_event in key_down_events:
-            if key_event.key == pygame.K_SPACE:
-                self.code += " "
-            if key_event.key == pygame.K_RETURN:
-                self.code += "\n"
-
-            if key_event.key == pygame.K_BACKSPACE:
-                if len(self.code) >= 2 and self.code[-2:] == "\n":
-                    self.code = self.code[:-2]
-                elif len(self.code) >= 1:
-                    self.code = self.code[:-1]
-                self.backspace_held = True
-
-            for char in ascii_lowercase:
-                if key_event.key == pygame.key.key_code(char):
-                    self.code += char.upper()
-
-            for digit in digits:
-                if key_event.key == pygame.key.key_code(digit):
-                    self.code += digit
-
-        for key_event in key_up_events:
-            if key_event.key == pygame.K_BACKSPACE:
-                self.backspace_held = False
-                self.backspace_startup = 0
-
+        # key presses and mouse clicks are handled as they come in by the _on_* event handlers
         # special (and lazy) backspace key repeat
         if self.backspace_held:
             if self.backspace_startup < 4:
@@ -154,29 +236,45 @@ class Interpreter:
                     self.code = self.code[:-2]
                 elif len(self.code) >= 1:
                     self.code = self.code[:-1]
+        self._compile()
 
+    def _on_key_down(self, key_event):
+        # no mouse input yet for text, only keyboard
+        # backspace and enter and text
+        if key_event.key in KEY_CHARACTERS:
+            self.code += KEY_CHARACTERS[key_event.key]
+
+        if key_event.key == pygame.K_BACKSPACE:
+            if len(self.code) >= 2 and self.code[-2:] == "\n":
+                self.code = self.code[:-2]
+            elif len(self.code) >= 1:
+                self.code = self.code[:-1]
+            self.backspace_held = True
+
+    def _on_key_up(self, key_event):
+        if key_event.key == pygame.K_BACKSPACE:
+            self.backspace_held = False
+            self.backspace_startup = 0
+
+    def _on_mouse_down(self, mouse_event):
         # check for button presses
-        mouse_down_events = pygame.event.get(eventtype=pygame.MOUSEBUTTONDOWN)
-        mouse_up_events = pygame.event.get(eventtype=pygame.MOUSEBUTTONUP)
-
-        for mouse_event in mouse_down_events:
-            if mouse_event.button == 1:
-                if 16 <= mouse_event.pos[1] <= 48:
-                    if 548 <= mouse_event.pos[0] <= 580:
-                        self.pressed_play = True
-                    elif 596 <= mouse_event.pos[0] <= 628:
-                        self.pressed_stop = True
-
-        for mouse_event in mouse_up_events:
-            if mouse_event.button == 1:
-                self.pressed_stop = False
-                self.pressed_play = False
-                if 16 <= mouse_event.pos[1] <= 48:
-                    if 548 <= mouse_event.pos[0] <= 580:
-                        self._reset()
-                        self.interpret()
-                    elif 596 <= mouse_event.pos[0] <= 628:
-                        self._reset()
+        if mouse_event.button == 1:
+            if 16 <= mouse_event.pos[1] <= 48:
+                if 548 <= mouse_event.pos[0] <= 580:
+                    self.pressed_play = True
+                elif 596 <= mouse_event.pos[0] <= 628:
+                    self.pressed_stop = True
+
+    def _on_mouse_up(self, mouse_event):
+        if mouse_event.button == 1:
+            self.pressed_stop = False
+            self.pressed_play = False
+            if 16 <= mouse_event.pos[1] <= 48:
+                if 548 <= mouse_event.pos[0] <= 580:
+                    self._reset()
+                    self.interpret()
+                elif 596 <= mouse_event.pos[0] <= 628:
+                    self._reset()
 
 
     def cmd_move(self, direction):
@@ -191,56 +289,21 @@ class Interpreter:
         time = int(time) # if this fails, interpret() will catch it
 
     def display_error(self, screen, error = "", update_error = True):
+        # returns the rect the error message was drawn in
         if update_error:
             self.error_display = error
 
-        font_surface, font_rect = self.font.render(self.error_display)
-        font_rect = font_rect.move(52, 16)
-        screen.blit(font_surface, font_rect)
+        # errors go under the code, in the border at the bottom
+        if self.error_cache is None or self.error_cache[0] != self.error_display:
+            font_surface, font_rect = self.font.render(self.error_display, fgcolor = (255, 110, 110))
+            self.error_cache = (self.error_display, font_surface, font_rect.move(36, 744))
+        screen.blit(self.error_cache[1], self.error_cache[2])
+        return self.error_cache[2]
 
     def interpret(self):
-        # input for interpreter:
-        # STOP
-        # JUMP
-        # MOVE <LEFT|RIGHT>
-        # ATTACK <UP|LEFT|RIGHT>
-        # WAIT <frames>
-        lines = self.code.split("\n")
-        framedata = []
-        current_action = ""
-        for line in lines:
-            words = line.split(" ")
-            if len(words) >= 1:
-                if words[0] == "STOP":
-                    framedata.append("stop")
-                elif words[0] == "JUMP":
-                    framedata.append("jump")
-                    for i in range(12):
-                        framedata.append("")
-                    framedata.append("endjump")
-                    for i in range(4):
-                        framedata.append("")
-                elif len(words) >= 2:
-                    if words[0] == "MOVE":
-                        if words[1] == "LEFT":
-                            framedata.append("left")
-                        elif words[1] == "RIGHT":
-                            framedata.append("right")
-                    if words[0] == "ATTACK":
-                        if words[1] == "LEFT":
-                            framedata.append("atk_left")
-                        elif words[1] == "RIGHT":
-                            framedata.append("atk_right")
-                        elif words[1] == "UP":
-                            framedata.append("atk_up")
-                    if words[0] == "WAIT":
-                        try:
-                            for i in range(int(words[1])):
-                                framedata.append("")
-                        except TypeError:
-                            pass
-        self.character.framedata = framedata[:]
-
+        # usually compiled already, unless the code was changed since the last frame
+        self._compile()
+        self.character.program = Executor(self.compiler.instructions)
 
 
 
@@ -1,39 +1,114 @@
 import pygame
 import sys
+import assets
 from character import Character
+from events import EventPump
 from interpreter import Interpreter
 from map import Map
+from profiler import Profiler
+from registry import MapRegistry
+from timestep import FixedTimestep
 import time
 import datetime as dt
 
-pygame.init()
+assets.init()
 
 # notes on size:
 # right side of the screen is square with 48x48 display area
-# (each block is 16 pixels, because we want to fit the entire map)
+# (each block is 16 pixels, because we want to fit the entire map. Larger maps scroll, see map.VIEW_SIZE)
 # map begins on pixel 672
 # writing section is 600 pixels wide on the left (offset of 36 on either side, additional 72 on the top for menu)
 
 screen = pygame.display.set_mode((1440, 768))
 pygame.display.set_caption("Trekking Pole Squad - CISxIdeasHackathon2021 Submission")
 clock = pygame.time.Clock()
-map = Map("map")
+events = EventPump()
+# maps are loaded through the registry, so switching between them is quick and edited maps are reloaded
+registry = MapRegistry()
+registry.start_watching()
+map = Map("map", registry = registry)
 character = Character(map)
-interpreter = Interpreter(map, character)
+interpreter = Interpreter(map, character, events)
 
 # hitbox and hurtbox debugging
 character.show_hitbox = False
 character.show_hurtbox = False
 # turn on for fps debugging
 fps_display = False
+# frames drawn per second. The game itself always runs at 30 ticks per second (see timestep.py)
 fps_limit = 30
+# F1 cycles through these speeds (ticks run per tick of game time)
+turbo_speeds = [1, 2, 4, 8, 16]
+# F2 skips ahead up to this many frames without drawing, stopping early once every target is broken
+fast_forward_frames = 30 * 60 * 10
+# F3 and F4 go this many frames back and forwards (see checkpoints.py)
+seek_frames = 30
+# turn on to time the interpreter, map, character, collisions and display.update (see profiler.py).
+# the overlay shows percentiles of each, and the trace is written as Chrome trace JSON when the game is closed
+profile = False
+profile_overlay = False
+profile_trace = None # e.g. "trace.json"
+
+profiler = Profiler()
+if profile:
+    profiler.instrument(interpreter, "run", "interpreter.run")
+    profiler.instrument(map, "run", "map.run")
+    profiler.instrument(character, "run", "character.run")
+    profiler.instrument(character, "_tick", "character._tick")
+    profiler.instrument(character, "_block_intersect", "character._block_intersect")
+    profiler.instrument(pygame.display, "update", "display.update")
+
+
+def quit_game(event):
+    if profile and profile_trace is not None:
+        profiler.export_chrome_trace(profile_trace)
+    sys.exit()
+
+
+events.register(pygame.QUIT, quit_game)
+
+timestep = FixedTimestep(lambda: interpreter.checkpoints.step(), lambda: character.total_frame)
+
+
+def on_key_down(key_event):
+    if key_event.key == pygame.K_F1:
+        timestep.turbo = turbo_speeds[(turbo_speeds.index(timestep.turbo) + 1) % len(turbo_speeds)]
+    elif key_event.key == pygame.K_F2:
+        if timestep.fast_forwarding():
+            timestep.stop_fast_forward()
+        else:
+            timestep.fast_forward(character.total_frame + fast_forward_frames)
+    elif key_event.key == pygame.K_F3:
+        interpreter.checkpoints.seek(character.total_frame - seek_frames)
+    elif key_event.key == pygame.K_F4:
+        interpreter.checkpoints.seek(character.total_frame + seek_frames)
+    elif key_event.key in (pygame.K_F5, pygame.K_F6):
+        # previous and next map, skipping files in the maps directory that aren't maps
+        names = registry.names()
+        index = names.index(map.file_name) if map.file_name in names else 0
+        for attempt in range(len(names)):
+            index += 1 if key_event.key == pygame.K_F6 else -1
+            try:
+                interpreter.load_map(names[index % len(names)], registry)
+                break
+            except (OSError, ValueError, IndexError):
+                continue
+
+
+events.register(pygame.KEYDOWN, on_key_down)
+
+# only the parts of the screen that change are drawn and updated each frame, so it's cleared once here
+screen.fill((0, 0, 0))
+pygame.display.flip()
+# where the profiler overlay was drawn last frame, the map is drawn back over it before it's drawn again
+overlay_rect = None
 
 total_frames = 0
 start_time = dt.datetime.today().timestamp()
 
 while True:
-    # cap game at 30fps
-    if fps_limit > 0:
+    # cap game at 30fps (fast forwarding runs as fast as it can)
+    if fps_limit > 0 and not timestep.fast_forwarding():
         clock.tick(fps_limit)
 
 
@@ -45,11 +120,33 @@ while True:
             start_time = dt.datetime.today().timestamp()
             total_frames = 0
 
-    if len(pygame.event.get(eventtype=pygame.QUIT)) >= 1:
-        sys.exit()
+    if profile:
+        profiler.mark_frame()
+
+    events.pump()
+
+    # the map being played was edited
+    if map.file_name in registry.changes():
+        interpreter.load_map(map.file_name, registry)
+
+    timestep.update()
+    # the run is over, so the frame it was won on can be shown
+    if timestep.fast_forwarding() and map.done:
+        timestep.stop_fast_forward()
+    # nothing is drawn while fast forwarding
+    if timestep.fast_forwarding():
+        continue
 
-    screen.fill((0, 0, 0))
-    interpreter.run(screen)
-    map.run(screen)
-    character.run(screen)
-    pygame.display.flip()
+    # maps larger than the view scroll to keep the character in the middle
+    map.follow(character.pos, character.size)
+    # each part returns the rects it drew on, and draws itself again where earlier parts drew over it
+    dirty = interpreter.run(screen)
+    if overlay_rect is not None:
+        dirty.append(overlay_rect)
+        overlay_rect = None
+    dirty += map.run(screen, dirty)
+    dirty += character.run(screen, dirty)
+    if profile and profile_overlay:
+        overlay_rect = profiler.render_overlay(screen)
+        dirty.append(overlay_rect)
+    pygame.display.update(dirty)
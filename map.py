@@ -1,151 +1,462 @@
 from os import path
+import struct
+import sys
+from collections import OrderedDict
+import numpy
 import pygame
 import random
-from pygame import freetype
+import assets
+
+# binary maps start with BINARY_MAGIC, then <width>, <height>, <spawn x>, <spawn y> (-1 if there is no spawnpoint),
+# followed by one byte per block, row by row. They can be memory-mapped straight into a grid
+BINARY_MAGIC = b"TPSMAP\x00\x01"
+BINARY_HEADER = struct.Struct("<8sIIii")
+
+# tiles shown on screen at once. Maps that fit are shown whole, larger ones scroll to follow the character
+VIEW_SIZE = (48, 48)
+# the map is drawn in square chunks of CHUNK_SIZE x CHUNK_SIZE tiles, baked when they first come into view and
+# dropped once they've been out of view for a while, so only the chunks around the view are kept
+CHUNK_SIZE = 16
+
+
+def read_map(file_path):
+    # returns (<grid>, <spawnpoint or None>) from a text or binary map, without truncating it
+    with open(file_path, "rb") as map_file:
+        is_binary = map_file.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+    if is_binary:
+        return read_binary_map(file_path)
+    return read_text_map(file_path)
+
+
+def read_text_map(file_path):
+    map_file = open(file_path, "r")
+    file_data = map_file.readlines()
+    map_file.close()
+
+    # first line is map size
+    width = int(file_data[0].split(",")[0])
+    height = int(file_data[0].split(",")[1])
+    file_data.pop(0)
+
+    # initialize map with only air
+    grid = numpy.zeros((height, width), dtype = numpy.uint8)
+    spawnpoint = None
+
+    # map data is sorted in <x>,<y>,<type>
+    # types are as follows:
+    # 0 - air
+    # 1 - floor
+    # 2 - target
+    # 3 - spawnpoint
+    for file_line in file_data:
+        # skip empty lines
+        if file_line != "\n":
+            point_info = file_line.split(",")
+            x = int(point_info[0])
+            y = int(point_info[1])
+            block_type = int(point_info[2])
+            # set the location using the information
+            if x < width and y < height:
+                # remove spawnpoint
+                if block_type == 3:
+                    spawnpoint = [x, y]
+                else:
+                    grid[y][x] = block_type
+    return grid, spawnpoint
+
+
+def write_text_map(file_path, grid, spawnpoint):
+    map_file = open(file_path, "w")
+    map_file.write(str(grid.shape[1]) + "," + str(grid.shape[0]) + "\n\n")
+    for y, x in numpy.argwhere(grid != 0):
+        map_file.write(str(x) + "," + str(y) + "," + str(grid[y][x]) + "\n")
+    if spawnpoint is not None:
+        map_file.write("\n" + str(spawnpoint[0]) + "," + str(spawnpoint[1]) + ",3\n")
+    map_file.close()
+
+
+def read_binary_map(file_path):
+    map_file = open(file_path, "rb")
+    magic, width, height, spawn_x, spawn_y = BINARY_HEADER.unpack(map_file.read(BINARY_HEADER.size))
+    map_file.close()
+
+    spawnpoint = [spawn_x, spawn_y] if spawn_x >= 0 and spawn_y >= 0 else None
+    if width == 0 or height == 0:
+        return numpy.zeros((height, width), dtype = numpy.uint8), spawnpoint
+    grid = numpy.memmap(file_path, dtype = numpy.uint8, mode = "r", offset = BINARY_HEADER.size,
+                        shape = (height, width))
+    return grid, spawnpoint
+
+
+def write_binary_map(file_path, grid, spawnpoint):
+    if spawnpoint is None:
+        spawnpoint = (-1, -1)
+    map_file = open(file_path, "wb")
+    map_file.write(BINARY_HEADER.pack(BINARY_MAGIC, grid.shape[1], grid.shape[0], spawnpoint[0], spawnpoint[1]))
+    map_file.write(numpy.ascontiguousarray(grid, dtype = numpy.uint8).tobytes())
+    map_file.close()
 
 
 class Map:
-    def __init__(self, file_name):
-        map_file = open(path.join(".", "maps", file_name), "r")
+    def __init__(self, file_name, headless = False, registry = None):
+        # headless maps only hold the grid for simulation: no textures or fonts are loaded, and run() can't be used
+        self.headless = headless
 
+        # where the view of the map is on the screen
         self.render_offset = (672, 0)
         self.pixel_size = (16, 16)
-        self.total_map_size = (48, 48)
-        # total map size in pixels will be 16x48 and 16x48
+        # view size in pixels will be 16x48 and 16x48
+        self.view_rect = pygame.Rect(self.render_offset, (VIEW_SIZE[0] * self.pixel_size[0],
+                                                          VIEW_SIZE[1] * self.pixel_size[1]))
+        # most chunks kept baked: enough for every chunk the view can overlap, and a ring around it
+        self.chunk_capacity = (VIEW_SIZE[0] // CHUNK_SIZE + 2) * (VIEW_SIZE[1] // CHUNK_SIZE + 2)
+
+        if not self.headless:
+            self._load_assets()
+        self.load(file_name, registry)
 
+    def load(self, file_name, registry = None):
+        # (re)load the map from maps/<file_name>, so the map can be changed without making a new Map.
+        # with a registry.MapRegistry the grid and baked chunks come from its cache instead of being made again
+        self.file_name = file_name
+        self.registry = registry
         self.done = False
 
         self.win_frames = 0
 
-        file_data = map_file.readlines()
-        # first line is map size, truncated to a maximum size of 46 (plus walls becomes 48)
-        width = int(file_data[0].split(",")[0])
-        height = int(file_data[0].split(",")[1])
-        file_data.pop(0)
-        width = (self.total_map_size[0] - 2) if width > (self.total_map_size[0] - 2) else width
-        height = (self.total_map_size[1] - 2) if height > (self.total_map_size[1] - 2) else height
-
+        # maps can be text or binary, see read_map()
+        if registry is not None:
+            grid, spawnpoint = registry.grid(file_name)
+        else:
+            grid, spawnpoint = read_map(path.join(".", "maps", file_name))
+        self.map = numpy.array(grid, dtype = numpy.uint8)
+        height, width = self.map.shape
         self.map_size = (width, height)
+        # size in tiles of the whole map with its walls. Maps smaller than the view are put in the middle of it
+        self.total_map_size = (max(width + 2, VIEW_SIZE[0]), max(height + 2, VIEW_SIZE[1]))
 
-        # initialize map with only air
-        self.map = [[0 for column in range(width)] for row in range(height)]
         self.spawnpoint = (0, 0)
-
-        # map data is sorted in <x>,<y>,<type>
-        # types are as follows:
-        # 0 - air
-        # 1 - floor
-        # 2 - target
-        # 3 - spawnpoint
-        for file_line in file_data:
-            # skip empty lines
-            if file_line != "\n":
-                point_info = file_line.split(",")
-                # set the location using the information
-                # remove spawnpoint
-                if int(point_info[0]) < self.map_size[0] and int(point_info[1]) < self.map_size[1]:
-                    if int(point_info[2]) == 3:
-                        self.spawnpoint = [int(point_info[0]), int(point_info[1])]
-                    else:
-                        self.map[int(point_info[1])][int(point_info[0])] = int(point_info[2])
+        if spawnpoint is not None and spawnpoint[0] < width and spawnpoint[1] < height:
+            self.spawnpoint = spawnpoint
 
         # render initialization
         # int() is built-in floor() function
         self.x_block_offset = int((self.total_map_size[0] - self.map_size[0]) / 2)
         self.y_block_offset = int((self.total_map_size[1] - self.map_size[1]) / 2)
 
-        self.render_map = [[1 for column in range(self.total_map_size[0])] for row in range(self.total_map_size[1])]
+        # place map on a grid of walls. reset_map() copies this back over render_map
+        self.start_render_map = numpy.ones((self.total_map_size[1], self.total_map_size[0]), dtype = numpy.uint8)
+        self.start_render_map[self.y_block_offset:self.y_block_offset + height,
+                              self.x_block_offset:self.x_block_offset + width] = self.map
+        self.render_map = self.start_render_map.copy()
+
+        self._index_targets()
+        self.all_targets = set(self.targets)
 
-        # place map on render_map
-        for y in range(self.map_size[1]):
-            for x in range(self.map_size[0]):
-                self.render_map[y + self.y_block_offset][x + self.x_block_offset] = self.map[y][x]
+        # top left of the view, in pixels from the top left of the map
+        self.camera = [0, 0]
+        # (x, y) of a chunk -> its surface, least recently used first
+        self.chunks = OrderedDict()
+        self._redraw_all()
 
+    def _load_assets(self):
         # init textures
         self.textures = [0] * 4
         self.textures[1] = []
         for frame in range(3):
-            self.textures[1].append(pygame.image.load(path.join(".", "images", "floor", str(frame)+".png")))
-
-        for texture_index in range(len(self.textures[1])):
-            self.textures[1][texture_index] = pygame.transform.scale(self.textures[1][texture_index], self.pixel_size)
+            self.textures[1].append(assets.image(path.join(".", "images", "floor", str(frame)+".png"), self.pixel_size))
 
-        self.textures[2] = pygame.image.load(path.join(".", "images", "target", "grounded.png"))
-        self.textures[2] = pygame.transform.scale(self.textures[2], self.pixel_size)
+        self.textures[2] = assets.image(path.join(".", "images", "target", "grounded.png"), self.pixel_size)
 
-        self.textures[3] = pygame.image.load(path.join(".", "images", "target", "aerial.png"))
-        self.textures[3] = pygame.transform.scale(self.textures[3], self.pixel_size)
+        self.textures[3] = assets.image(path.join(".", "images", "target", "aerial.png"), self.pixel_size)
 
-        self.background = pygame.image.load(path.join(".", "images", "background.png"))
-        self.background = pygame.transform.scale(self.background, (self.total_map_size[0] * self.pixel_size[0],
-                                                                   self.total_map_size[1] * self.pixel_size[1]))
+        # the size of the view, and repeated across maps larger than it
+        self.background = assets.image(path.join(".", "images", "background.png"),
+                                       (VIEW_SIZE[0] * self.pixel_size[0], VIEW_SIZE[1] * self.pixel_size[1]))
 
-        pygame.init()
+        # the font is shared, so the size and colour are given when rendering
+        self.font = assets.font("Menlo.ttc")
 
-        self.font = pygame.freetype.Font(path.join(".", "fonts", "Menlo.ttc"))
-        self.font.size = 32
-        self.font.fgcolor = (156, 170, 255)
-
-    def run(self, screen):
+    def run(self, screen, dirty = ()):
         # render over gameplay, and stop gameplay (follow through)
-        self._render(screen)
+        # dirty are the rects of the screen already drawn on this frame, the map is drawn again wherever they
+        # overlap it. Returns the rects of the screen that were drawn on
+        rects = self._render(screen, dirty)
         if self.done:
-            self._render_win_screen(screen)
+            rects += self._render_win_screen(screen, list(dirty) + rects)
+        else:
+            self.drawn_win_frames = None
+        return rects
 
     def reset_map(self):
         self.win_frames = 0
-        self.render_map = [[1 for column in range(self.total_map_size[0])] for row in range(self.total_map_size[1])]
+        self.restore_targets(self.all_targets)
+
+    def snapshot(self):
+        # everything about the map that changes as the game runs (see checkpoints.py), to give to restore()
+        # the targets only change when one breaks or a snapshot is restored, so the same frozenset is kept until then
+        if self.frozen_targets is None:
+            self.frozen_targets = frozenset(self.targets)
+        return self.frozen_targets, self.done, self.win_frames
+
+    def restore(self, state):
+        targets, self.done, self.win_frames = state
+        self.restore_targets(targets)
 
-        # place map on render_map
-        for y in range(self.map_size[1]):
-            for x in range(self.map_size[0]):
-                self.render_map[y + self.y_block_offset][x + self.x_block_offset] = self.map[y][x]
+    def restore_targets(self, targets):
+        # make targets the targets left. Only the tiles of targets that differ are changed
+        changed = self.targets ^ targets
+        for x, y in changed:
+            self.render_map[y, x] = 2 if (x, y) in targets else 0
+        self.targets = set(targets)
+        self.frozen_targets = targets if type(targets) == frozenset else None
+
+        # only those (and the targets above them) are drawn again
+        if not self.headless:
+            for x, y in changed:
+                self._bake_tile(x, y)
+                if y > 0 and self.render_map[y - 1, x] == 2:
+                    self._bake_tile(x, y - 1)
+
+    def _index_targets(self):
+        # (x, y) of every target left on render_map, so finding and counting targets doesn't need a scan
+        self.targets = set((int(x), int(y)) for y, x in numpy.argwhere(self.render_map == 2))
+        # the targets as a frozenset for snapshot(), None until it's needed
+        self.frozen_targets = None
+
+    def follow(self, pos, size):
+        # scroll the view so the rect (in the same coordinates as Character.pos) is in the middle of it, without
+        # going past the edges of the map. Maps that fit in the view never scroll
+        for axis in (0, 1):
+            view = VIEW_SIZE[axis] * self.pixel_size[axis]
+            total = self.total_map_size[axis] * self.pixel_size[axis]
+            centre = pos[axis] - self.render_offset[axis] + size[axis] / 2
+            self.camera[axis] = min(max(int(centre - view / 2), 0), total - view)
+
+    def to_screen(self, rect):
+        # where a rect in the same coordinates as Character.pos is on the screen
+        return pygame.Rect(rect).move(-self.camera[0], -self.camera[1])
+
+    def tile_range(self, pos, size):
+        # range of tile indices (x_range, y_range) that a rect overlaps
+        # coordinates are truncated to int the same way pygame.Rect does, so results match colliderect
+        left = int(pos[0]) - self.render_offset[0]
+        top = int(pos[1]) - self.render_offset[1]
+        width = int(size[0])
+        height = int(size[1])
+        if width <= 0 or height <= 0:
+            return range(0), range(0)
+
+        x_start = max(left // self.pixel_size[0], 0)
+        x_end = min((left + width - 1) // self.pixel_size[0] + 1, self.total_map_size[0])
+        y_start = max(top // self.pixel_size[1], 0)
+        y_end = min((top + height - 1) // self.pixel_size[1] + 1, self.total_map_size[1])
+        return range(x_start, x_end), range(y_start, y_end)
+
+    def find_block(self, pos, size, block_type = 1):
+        # first tile of block_type overlapped by the rect (row by row, like a full scan of render_map), or None
+        x_range, y_range = self.tile_range(pos, size)
+        for y in y_range:
+            # plain lists are quicker to search than numpy for a few tiles
+            row = self.render_map[y, x_range.start:x_range.stop].tolist()
+            if block_type in row:
+                return x_range.start + row.index(block_type), y
+        return None
+
+    def first_clear(self, pos, size, axis, direction, limit):
+        # first whole pixel coordinate along axis (0 = x, 1 = y), starting from pos and moving in direction (1 or -1),
+        # where the rect no longer overlaps a floor block. None if the rect is still blocked once it passes limit
+        test_pos = [pos[0], pos[1]]
+        coord = int(pos[axis])
+        while (limit - coord) * direction >= 0:
+            test_pos[axis] = coord
+            block = self.find_block(test_pos, size)
+            if block is None:
+                return coord
+            # every coordinate until the rect is past this block is blocked as well, so skip straight past it
+            block_start = self.render_offset[axis] + block[axis] * self.pixel_size[axis]
+            if direction > 0:
+                coord = block_start + self.pixel_size[axis]
+            else:
+                coord = block_start - int(size[axis])
+        return None
+
+    def break_targets(self, pos, size):
+        # break every target the rect overlaps, returns how many were broken
+        x_range, y_range = self.tile_range(pos, size)
+        hits = [(x, y) for y in y_range for x in x_range if (x, y) in self.targets]
+        for x, y in hits:
+            self.break_target(x, y)
+        return len(hits)
 
     def break_target(self, x, y):
         # assume the sword hitbox intersection was checked already
-        self.render_map[y][x] = 0
-
-        # check if all targets are gone and end game when all are gone
-        end_game = True
-        for row in self.render_map:
-            if 2 in row:
-                end_game = False
-        self.done = end_game
-
-    def _render(self, screen):
-        # render background
-        screen.blit(self.background, self.render_offset)
-
-        # render foreground
-        for y in range(self.total_map_size[1]):
-            for x in range(self.total_map_size[0]):
-                block_rect = pygame.Rect((self.render_offset[0] + x * self.pixel_size[0],
-                                          self.render_offset[1] + y * self.pixel_size[1],
-                                          self.pixel_size[0],
-                                          self.pixel_size[1]))
-                # don't render air
-                if self.render_map[y][x] != 0:
-                    # if texture has list, randomize based on seed (constant output for specified x,y)
-                    if type(self.textures[self.render_map[y][x]]) == list:
-                        # some random equation. Originally was x * y but that would make the textures mirrored in y = x
-                        random.seed((5 * x) ** 2 + (3 * y))
-                        texture = random.choice(self.textures[self.render_map[y][x]])
+        self.render_map[y, x] = 0
+        self.targets.discard((x, y))
+        self.frozen_targets = None
+
+        # a target's texture depends on the block below it, so the target above has to be redrawn too
+        if not self.headless:
+            self._bake_tile(x, y)
+            if y > 0 and self.render_map[y - 1, x] == 2:
+                self._bake_tile(x, y - 1)
+
+        # end game when all targets are gone
+        self.done = len(self.targets) == 0
+
+    def _render(self, screen, dirty = ()):
+        # background and blocks are baked into chunks, see _chunk()
+        # the whole view is drawn when it first appears or scrolls. Otherwise only tiles baked since the last frame
+        # are drawn, and anything in dirty drawn over the map
+        if self.drawn_camera == self.camera:
+            rects = [self.redraw(screen, self.to_screen(rect.move(self.render_offset))) for rect in self.dirty_tiles]
+            rects += [self.redraw(screen, rect) for rect in dirty]
+            rects = [rect for rect in rects if rect.width > 0 and rect.height > 0]
+        else:
+            rects = [self.redraw(screen, self.view_rect)]
+            self.drawn_camera = self.camera[:]
+        self.dirty_tiles = []
+        return rects
+
+    def redraw(self, screen, rect):
+        # draw the map back over the part of rect that is in the view, to clear what was drawn there.
+        # returns the rect of the screen drawn on (empty if rect isn't in the view)
+        screen_rect = pygame.Rect(rect).clip(self.view_rect)
+        # the same rect in pixels from the top left of the map
+        map_rect = screen_rect.move(self.camera[0] - self.render_offset[0], self.camera[1] - self.render_offset[1])
+        chunk_width = CHUNK_SIZE * self.pixel_size[0]
+        chunk_height = CHUNK_SIZE * self.pixel_size[1]
+        for chunk_y in range(map_rect.top // chunk_height, (map_rect.bottom - 1) // chunk_height + 1):
+            for chunk_x in range(map_rect.left // chunk_width, (map_rect.right - 1) // chunk_width + 1):
+                chunk_rect = pygame.Rect(chunk_x * chunk_width, chunk_y * chunk_height, chunk_width, chunk_height)
+                area = map_rect.clip(chunk_rect)
+                screen.blit(self._chunk(chunk_x, chunk_y),
+                            area.move(self.render_offset[0] - self.camera[0], self.render_offset[1] - self.camera[1]),
+                            area.move(-chunk_rect.x, -chunk_rect.y))
+        return screen_rect
+
+    def _chunk(self, chunk_x, chunk_y):
+        # surface of a chunk, baked if it isn't already
+        chunk = (chunk_x, chunk_y)
+        if chunk in self.chunks:
+            self.chunks.move_to_end(chunk)
+            return self.chunks[chunk]
+
+        # chunks baked with every target in place are shared through the registry
+        x_range, y_range = self._chunk_tiles(chunk_x, chunk_y)
+        intact = (self.render_map[y_range.start:y_range.stop, x_range.start:x_range.stop] ==
+                  self.start_render_map[y_range.start:y_range.stop, x_range.start:x_range.stop]).all()
+        surface = self.registry.tile_chunk(self.file_name, chunk) if self.registry is not None and intact else None
+        if surface is not None:
+            # the cached chunk is shared, and chunks are drawn on when targets break
+            surface = surface.copy()
+        else:
+            surface = self._bake_chunk(chunk_x, chunk_y)
+            if self.registry is not None and intact:
+                self.registry.store_tile_chunk(self.file_name, chunk, surface.copy())
+
+        self.chunks[chunk] = surface
+        while len(self.chunks) > self.chunk_capacity:
+            self.chunks.popitem(last = False)
+        return surface
+
+    def _chunk_tiles(self, chunk_x, chunk_y):
+        # range of tile indices (x_range, y_range) in a chunk. Chunks on the edges can be cut off by the map
+        return (range(chunk_x * CHUNK_SIZE, min((chunk_x + 1) * CHUNK_SIZE, self.total_map_size[0])),
+                range(chunk_y * CHUNK_SIZE, min((chunk_y + 1) * CHUNK_SIZE, self.total_map_size[1])))
+
+    def _bake_chunk(self, chunk_x, chunk_y):
+        # draw the background and every block of a chunk once. After this only tiles that change (broken targets)
+        # are drawn on it again
+        chunk_width = CHUNK_SIZE * self.pixel_size[0]
+        chunk_height = CHUNK_SIZE * self.pixel_size[1]
+        surface = pygame.Surface((chunk_width, chunk_height))
+        # the background repeats every view, so the part of it under the chunk can wrap around
+        background_width, background_height = self.background.get_size()
+        left = -(chunk_x * chunk_width % background_width)
+        top = -(chunk_y * chunk_height % background_height)
+        for x in range(left, chunk_width, background_width):
+            for y in range(top, chunk_height, background_height):
+                surface.blit(self.background, (x, y))
+
+        x_range, y_range = self._chunk_tiles(chunk_x, chunk_y)
+        for y in y_range:
+            for x in x_range:
+                self._bake_tile(x, y, clear = False, surface = surface)
+        return surface
+
+    def _redraw_all(self):
+        # the whole view is drawn on the next frame, after that only tiles baked again (kept in dirty_tiles)
+        self.drawn_camera = None
+        self.dirty_tiles = []
+        # win_frames shown on the win screen drawn on the screen, None if it isn't shown
+        self.drawn_win_frames = None
+
+    def _bake_tile(self, x, y, clear = True, surface = None):
+        # draws a tile on its chunk, if the chunk is baked (otherwise it's drawn once the chunk is baked)
+        if surface is None:
+            surface = self.chunks.get((x // CHUNK_SIZE, y // CHUNK_SIZE))
+            if surface is None:
+                return
+        # chunks start at their top left tile, not at render_offset
+        block_rect = pygame.Rect((x % CHUNK_SIZE * self.pixel_size[0],
+                                  y % CHUNK_SIZE * self.pixel_size[1],
+                                  self.pixel_size[0],
+                                  self.pixel_size[1]))
+        # clear whatever was drawn here before
+        if clear:
+            background_rect = pygame.Rect(x * self.pixel_size[0] % self.background.get_width(),
+                                          y * self.pixel_size[1] % self.background.get_height(),
+                                          self.pixel_size[0], self.pixel_size[1])
+            surface.fill((0, 0, 0), block_rect)
+            surface.blit(self.background, block_rect, background_rect)
+            # in pixels from the top left of the map
+            self.dirty_tiles.append(pygame.Rect(x * self.pixel_size[0], y * self.pixel_size[1],
+                                                self.pixel_size[0], self.pixel_size[1]))
+
+        block_type = int(self.render_map[y, x])
+        # don't render air
+        if block_type != 0:
+            # if texture has list, randomize based on seed (constant output for specified x,y)
+            if type(self.textures[block_type]) == list:
+                # some random equation. Originally was x * y but that would make the textures mirrored in y = x
+                random.seed((5 * x) ** 2 + (3 * y))
+                texture = random.choice(self.textures[block_type])
+            else:
+                if block_type == 2:
+                    if self.render_map[y + 1, x] == 1:
+                        texture = self.textures[2]
                     else:
-                        if self.render_map[y][x] == 2:
-                            if self.render_map[y+1][x] == 1:
-                                texture = self.textures[2]
-                            else:
-                                texture = self.textures[3]
-                        else:
-                            texture = self.textures[self.render_map[y][x]]
-                    screen.blit(texture, block_rect)
-
-    def _render_win_screen(self, screen):
-        background = pygame.Surface((600,660))
-        background.fill((46, 42, 54))
-        screen.blit(background,pygame.Rect(36, 72, 600, 660))
-
-        font_surface, font_rect = self.font.render("time: "+str(self.win_frames)+" frames")
+                        texture = self.textures[3]
+                else:
+                    texture = self.textures[block_type]
+            surface.blit(texture, block_rect)
+
+    def _render_win_screen(self, screen, dirty = ()):
+        # drawn once when it appears, and again when win_frames changes or something is drawn over it
+        win_rect = pygame.Rect(36, 72, 600, 660)
+        if self.drawn_win_frames == self.win_frames and win_rect.collidelist(list(dirty)) == -1:
+            return []
+        self.drawn_win_frames = self.win_frames
+
+        screen.fill((46, 42, 54), win_rect)
+
+        font_surface, font_rect = self.font.render("time: "+str(self.win_frames)+" frames",
+                                                   fgcolor = (156, 170, 255), size = 32)
         font_rect.center = (336, 384)
         screen.blit(font_surface, font_rect)
+        return [win_rect]
+
+
 
+if __name__ == "__main__":
+    # converts a map between the text and binary formats: python map.py <input map> <output map> [text|binary]
+    # the output is binary unless the input already is, or the format is given
+    grid, spawnpoint = read_map(sys.argv[1])
+    with open(sys.argv[1], "rb") as input_file:
+        input_binary = input_file.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+    output_format = sys.argv[3] if len(sys.argv) > 3 else ("text" if input_binary else "binary")
+    if output_format == "text":
+        write_text_map(sys.argv[2], grid, spawnpoint)
+    else:
+        write_binary_map(sys.argv[2], grid, spawnpoint)
@@ -0,0 +1,126 @@
+import json
+import time
+from array import array
+import pygame
+import assets
+
+# times how long chosen functions take. Functions are timed by replacing them with a wrapper (see instrument()),
+# so nothing is added to them at all while profiling is off. Each timed function keeps its last CAPACITY calls
+# in a ring buffer, which can be shown as percentiles on screen or exported as a Chrome trace
+# (open it in chrome://tracing or https://ui.perfetto.dev)
+CAPACITY = 4096
+
+
+class Section:
+    # ring buffer of (<start>, <duration>) in nanoseconds for one timed function
+    def __init__(self, capacity):
+        self.starts = array("q", bytes(8 * capacity))
+        self.durations = array("q", bytes(8 * capacity))
+        self.capacity = capacity
+        # total number of calls recorded, the next one goes at count % capacity
+        self.count = 0
+
+    def add(self, start, duration):
+        index = self.count % self.capacity
+        self.starts[index] = start
+        self.durations[index] = duration
+        self.count += 1
+
+    def recorded(self):
+        # (<start>, <duration>) of every call still in the buffer, oldest first
+        if self.count <= self.capacity:
+            return list(zip(self.starts[:self.count], self.durations[:self.count]))
+        index = self.count % self.capacity
+        return list(zip(self.starts[index:] + self.starts[:index], self.durations[index:] + self.durations[:index]))
+
+    def percentiles(self, percents):
+        # duration in nanoseconds at each percent of the calls in the buffer (nearest rank), None if there are none
+        size = min(self.count, self.capacity)
+        if size == 0:
+            return [None] * len(percents)
+        durations = sorted(self.durations[:size])
+        return [durations[min(size - 1, int(percent / 100 * size))] for percent in percents]
+
+
+class Profiler:
+    def __init__(self, capacity = CAPACITY):
+        self.capacity = capacity
+        # name -> Section, in the order they were added
+        self.sections = {}
+        # (<owner>, <attribute>, <original>, <replaced in owner's __dict__>) of every instrumented function
+        self.instrumented = []
+        self.last_frame = None
+
+    def section(self, name):
+        if name not in self.sections:
+            self.sections[name] = Section(self.capacity)
+        return self.sections[name]
+
+    def instrument(self, owner, attribute, name = None):
+        # time every call to owner.<attribute> (a module function or a bound method of an object) under name
+        original = getattr(owner, attribute)
+        section = self.section(name or attribute)
+        perf_counter_ns = time.perf_counter_ns
+
+        def timed(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                section.add(start, perf_counter_ns() - start)
+
+        own_attribute = attribute in getattr(owner, "__dict__", {})
+        self.instrumented.append((owner, attribute, original, own_attribute))
+        setattr(owner, attribute, timed)
+
+    def remove(self):
+        # put every instrumented function back, the recorded timings are kept
+        for owner, attribute, original, own_attribute in reversed(self.instrumented):
+            if own_attribute:
+                setattr(owner, attribute, original)
+            else:
+                # a method of the class was shadowed by the wrapper, so removing it uses the class's one again
+                delattr(owner, attribute)
+        self.instrumented = []
+
+    def mark_frame(self):
+        # call once per frame to record the whole frame's time as "frame"
+        now = time.perf_counter_ns()
+        if self.last_frame is not None:
+            self.section("frame").add(self.last_frame, now - self.last_frame)
+        self.last_frame = now
+
+    def summary(self, percents = (50, 95, 99)):
+        # name -> (<calls recorded>, [<milliseconds at each percent>...], <slowest in milliseconds>)
+        result = {}
+        for name, section in self.sections.items():
+            if section.count == 0:
+                continue
+            values = section.percentiles(list(percents) + [100])
+            result[name] = (section.count, [value / 1e6 for value in values[:-1]], values[-1] / 1e6)
+        return result
+
+    def render_overlay(self, screen, pos = (680, 8)):
+        # percentiles of every section, drawn over the top left of the map. Returns the rect drawn on
+        # the font is shared, so the size and colours are given when rendering
+        font = assets.font("Menlo.ttc")
+        lines = ["{:18} {:>8} {:>8} {:>8} {:>8}".format("ms", "p50", "p95", "p99", "max")]
+        for name, (count, values, slowest) in self.summary().items():
+            lines.append("{:18} {:8.3f} {:8.3f} {:8.3f} {:8.3f}".format(name, *values, slowest))
+        rect = pygame.Rect(pos, (0, 0))
+        for line_number, line in enumerate(lines):
+            rect.union_ip(font.render_to(screen, (pos[0], pos[1] + line_number * 14), line,
+                                         fgcolor = (255, 255, 255), bgcolor = (0, 0, 0), size = 12))
+        return rect
+
+    def export_chrome_trace(self, file_path):
+        # every call still in the buffers as a complete ("X") event, times in microseconds
+        events = []
+        for name, section in self.sections.items():
+            for start, duration in section.recorded():
+                events.append({"name": name, "ph": "X", "ts": start / 1000, "dur": duration / 1000,
+                               "pid": 0, "tid": 0})
+        # calls that start together are nested, so the outer (longer) one goes first
+        events.sort(key = lambda event: (event["ts"], -event["dur"]))
+        with open(file_path, "w") as trace_file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
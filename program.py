@@ -0,0 +1,176 @@
+# programs are compiled into a short list of instructions instead of one input per frame:
+# ("act", <input>) - one frame with an input for Character._tick (jump, left, right, stop, atk_left...)
+# ("wait", <frames>) - a number of frames with no input
+# ("repeat", <times>) ... ("end", None) - run the instructions in between a number of times
+# an Executor steps through them with a cursor, so a program never takes more memory than its own text
+
+# input for each direction of MOVE and ATTACK
+MOVES = {"LEFT": "left", "RIGHT": "right"}
+ATTACKS = {"LEFT": "atk_left", "RIGHT": "atk_right", "UP": "atk_up"}
+
+
+def compile_program(code):
+    # input for interpreter:
+    # STOP
+    # JUMP
+    # MOVE <LEFT|RIGHT>
+    # ATTACK <UP|LEFT|RIGHT>
+    # WAIT <frames>
+    # REPEAT <times>
+    # END (closes the last REPEAT)
+    # lines that aren't valid are left out (see parse_line() for why)
+    return assemble([parse_line(line) for line in code.split("\n")])[0]
+
+
+def parse_line(line):
+    # returns (<operations>, <error message or None>) for one line. Operations are instructions, plus
+    # ("repeat", <times>) and ("end", None) for blocks, which only make sense once every line is put together
+    words = line.split(" ")
+    if words[0] == "":
+        if len(words) == 1:
+            return [], None
+        return [], "unexpected space"
+    if words[0] == "STOP":
+        return [("act", "stop")], None
+    if words[0] == "JUMP":
+        # the character leaves the ground character.JUMP_FRAMES frames later by itself
+        return [("act", "jump"), ("wait", 17)], None
+    if words[0] == "END":
+        return [("end", None)], None
+
+    if words[0] == "MOVE":
+        if len(words) >= 2 and words[1] in MOVES:
+            return [("act", MOVES[words[1]])], None
+        return [], "MOVE needs LEFT or RIGHT"
+    if words[0] == "ATTACK":
+        if len(words) >= 2 and words[1] in ATTACKS:
+            return [("act", ATTACKS[words[1]])], None
+        return [], "ATTACK needs UP, LEFT or RIGHT"
+    if words[0] in ("WAIT", "REPEAT"):
+        try:
+            return [(words[0].lower(), int(words[1]))], None
+        except (IndexError, ValueError):
+            return [], words[0] + (" needs a number of frames" if words[0] == "WAIT" else " needs a number of times")
+    return [], "unknown command " + words[0]
+
+
+def assemble(parsed_lines):
+    # puts the parsed lines together into instructions. Returns (<instructions>, <errors>), where errors are
+    # (<line number>, <message>) for every line that was left out
+    # each open REPEAT is [<times>, <instructions in its body>]
+    blocks = [[1, []]]
+    errors = []
+    for line_number, (operations, error) in enumerate(parsed_lines):
+        if error is not None:
+            errors.append((line_number, error))
+        for operation in operations:
+            instructions = blocks[-1][1]
+            if operation[0] == "wait":
+                _add_wait(instructions, operation[1])
+            elif operation[0] == "repeat":
+                blocks.append([operation[1], []])
+            elif operation[0] == "end":
+                if len(blocks) > 1:
+                    _close_block(blocks)
+                else:
+                    errors.append((line_number, "END without REPEAT"))
+            else:
+                instructions.append(operation)
+
+    # a REPEAT without an END runs to the end of the program
+    while len(blocks) > 1:
+        _close_block(blocks)
+    return blocks[0][1], errors
+
+
+class Compiler:
+    # compiles code as it is edited. Every line's parse is kept by its text, so after an edit only the lines that
+    # changed are parsed again, and the program is already compiled when it is run
+    def __init__(self):
+        self.code = None
+        # line text -> parse_line(<line text>) for every line in code
+        self.parsed = {}
+        self.instructions = []
+        # (<line number>, <message>) of every line that was left out
+        self.errors = []
+
+    def update(self, code):
+        # returns whether the code changed
+        if code == self.code:
+            return False
+        parsed = {}
+        parsed_lines = []
+        for line in code.split("\n"):
+            if line not in parsed:
+                parsed[line] = self.parsed[line] if line in self.parsed else parse_line(line)
+            parsed_lines.append(parsed[line])
+        # lines that aren't in the code any more are forgotten
+        self.parsed = parsed
+        self.instructions, self.errors = assemble(parsed_lines)
+        self.code = code
+        return True
+
+
+def _add_wait(instructions, frames):
+    # consecutive waits are merged, and empty ones are left out
+    if frames <= 0:
+        return
+    if len(instructions) > 0 and instructions[-1][0] == "wait":
+        instructions[-1] = ("wait", instructions[-1][1] + frames)
+    else:
+        instructions.append(("wait", frames))
+
+
+def _close_block(blocks):
+    times, body = blocks.pop()
+    # loops that would run zero times or take zero frames are dropped, so every pass of a loop takes at least one frame
+    if times > 0 and len(body) > 0:
+        blocks[-1][1].append(("repeat", times))
+        blocks[-1][1].extend(body)
+        blocks[-1][1].append(("end", None))
+
+
+class Executor:
+    # runs a compiled program one frame at a time
+    def __init__(self, instructions):
+        self.instructions = instructions
+        self.position = 0
+        self.wait_left = 0
+        # [<position of the loop body>, <passes left>] of each loop being run
+        self.loops = []
+
+    def finished(self):
+        # True once every frame of the program has been run
+        return self.wait_left == 0 and self.position >= len(self.instructions)
+
+    def next_action(self):
+        # input for the current frame, "" for no input, or None once the program has finished
+        if self.wait_left > 0:
+            self.wait_left -= 1
+            return ""
+
+        while self.position < len(self.instructions):
+            instruction = self.instructions[self.position]
+            self.position += 1
+            if instruction[0] == "act":
+                return instruction[1]
+            elif instruction[0] == "wait":
+                self.wait_left = instruction[1] - 1
+                return ""
+            elif instruction[0] == "repeat":
+                self.loops.append([self.position, instruction[1]])
+            elif instruction[0] == "end":
+                self.loops[-1][1] -= 1
+                if self.loops[-1][1] > 0:
+                    self.position = self.loops[-1][0]
+                else:
+                    self.loops.pop()
+        return None
+
+    def snapshot(self):
+        # where the program is up to, see restore()
+        return self.position, self.wait_left, tuple(tuple(loop) for loop in self.loops)
+
+    def restore(self, state):
+        self.position, self.wait_left, loops = state
+        self.loops = [list(loop) for loop in loops]
@@ -0,0 +1,140 @@
+import os
+import threading
+from collections import OrderedDict
+from os import path
+import numpy
+from map import read_map
+
+# every map in the maps directory, with the grids and baked chunks of the most recently used ones kept in
+# memory so switching between them doesn't read, parse or draw anything again. A background thread can watch the
+# directory: edited maps are parsed again on that thread, and the game picks them up with changes()
+MAPS_DIR = path.join(".", "maps")
+
+
+class MapRegistry:
+    def __init__(self, directory = MAPS_DIR, capacity = 8, chunk_capacity = 32):
+        self.directory = directory
+        # most maps kept in memory at once, and most baked chunks kept for each one
+        self.capacity = capacity
+        self.chunk_capacity = chunk_capacity
+
+        # name -> {"stat": (<mtime ns>, <size>), "grid": ..., "spawnpoint": ..., "chunks": {(<x>, <y>): <surface>}},
+        # least recently used first (chunks too)
+        self.cache = OrderedDict()
+        # name -> (<mtime ns>, <size>) of every map in the directory
+        self.files = self._scan()
+        # names of cached maps that have been parsed again since changes() was last called
+        self.changed = set()
+        # the watcher thread changes the cache too
+        self.lock = threading.Lock()
+
+        self.watcher = None
+        self.stop_event = threading.Event()
+
+    def names(self):
+        with self.lock:
+            return sorted(self.files)
+
+    def grid(self, name):
+        # (<grid>, <spawnpoint>) of a map, as read_map() gives them
+        with self.lock:
+            entry = self._get(name)
+        if entry is None:
+            entry = self._parse(name)
+            with self.lock:
+                self._put(name, entry)
+        return entry["grid"], entry["spawnpoint"]
+
+    def tile_chunk(self, name, chunk):
+        # a baked chunk (see Map._chunk) of a map with every target in place, None if there isn't one yet.
+        # it's shared, so it should be copied before drawing on it
+        with self.lock:
+            entry = self._get(name)
+            if entry is None or chunk not in entry["chunks"]:
+                return None
+            entry["chunks"].move_to_end(chunk)
+            return entry["chunks"][chunk]
+
+    def store_tile_chunk(self, name, chunk, surface):
+        with self.lock:
+            if name in self.cache:
+                chunks = self.cache[name]["chunks"]
+                chunks[chunk] = surface
+                chunks.move_to_end(chunk)
+                while len(chunks) > self.chunk_capacity:
+                    chunks.popitem(last = False)
+
+    def changes(self):
+        # names of maps that were edited and parsed again since the last call, for the game to reload
+        with self.lock:
+            changed = self.changed
+            self.changed = set()
+        return changed
+
+    def start_watching(self, interval = 1.0):
+        # check the directory for edited, added and removed maps every interval seconds on a background thread
+        if self.watcher is None:
+            self.stop_event.clear()
+            self.watcher = threading.Thread(target = self._watch, args = (interval,), daemon = True)
+            self.watcher.start()
+
+    def stop_watching(self):
+        if self.watcher is not None:
+            self.stop_event.set()
+            self.watcher.join()
+            self.watcher = None
+
+    def _watch(self, interval):
+        while not self.stop_event.wait(interval):
+            self.check()
+
+    def check(self):
+        # parse every cached map whose file changed again. Only the changed files are read
+        files = self._scan()
+        with self.lock:
+            self.files = files
+            stale = [name for name, entry in self.cache.items() if files.get(name) != entry["stat"]]
+        for name in stale:
+            if name not in files:
+                with self.lock:
+                    self.cache.pop(name, None)
+                continue
+            try:
+                entry = self._parse(name)
+            except (OSError, ValueError, IndexError):
+                # probably still being written, try again next time
+                continue
+            with self.lock:
+                if name in self.cache:
+                    self.cache[name] = entry
+                    self.changed.add(name)
+
+    def _scan(self):
+        files = {}
+        for dir_entry in os.scandir(self.directory):
+            if dir_entry.is_file():
+                stat = dir_entry.stat()
+                files[dir_entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def _parse(self, name):
+        file_path = path.join(self.directory, name)
+        stat = os.stat(file_path)
+        grid, spawnpoint = read_map(file_path)
+        # copied out of binary maps, which are memory-mapped and could be rewritten while cached
+        return {"stat": (stat.st_mtime_ns, stat.st_size), "grid": numpy.array(grid), "spawnpoint": spawnpoint,
+                "chunks": OrderedDict()}
+
+    def _get(self, name):
+        # the cached entry of a map (marked as just used), None if it isn't cached. Call with lock held
+        if name not in self.cache:
+            return None
+        self.cache.move_to_end(name)
+        return self.cache[name]
+
+    def _put(self, name, entry):
+        # call with lock held
+        self.cache[name] = entry
+        self.cache.move_to_end(name)
+        while len(self.cache) > self.capacity:
+            self.cache.popitem(last = False)
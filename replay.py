@@ -0,0 +1,115 @@
+import base64
+import hashlib
+import json
+import struct
+import sys
+import zlib
+from array import array
+from os import path
+from simulation import Simulation
+
+# a recording holds the program, a hash of the map file and a checksum of the game state after every frame.
+# replaying it runs the program again headlessly and finds the first frame where the state is different,
+# which shows whether a change to the physics or collision code changed gameplay
+RECORDING_VERSION = 1
+
+
+def map_hash(map_name):
+    with open(path.join(".", "maps", map_name), "rb") as map_file:
+        return hashlib.sha1(map_file.read()).hexdigest()
+
+
+def state_checksum(simulation):
+    # exact float bits of the position and velocity, plus every target left
+    character = simulation.character
+    state = struct.pack("<dddd", character.pos[0], character.pos[1], character.velocity[0], character.velocity[1])
+    for target in sorted(simulation.map.targets):
+        state += struct.pack("<HH", target[0], target[1])
+    return zlib.crc32(state)
+
+
+def record(map_name, code, max_frames):
+    # runs until the win is recorded or max_frames frames have been run
+    simulation = Simulation(map_name, code)
+    checksums = array("I")
+    while simulation.map.win_frames == 0 and simulation.character.total_frame < max_frames:
+        simulation.step()
+        checksums.append(state_checksum(simulation))
+
+    if sys.byteorder != "little":
+        checksums.byteswap()
+    return {
+        "version": RECORDING_VERSION,
+        "map": map_name,
+        "map_hash": map_hash(map_name),
+        "program": code,
+        "win_frames": simulation.map.win_frames,
+        "checksums": base64.b64encode(checksums.tobytes()).decode("ascii")
+    }
+
+
+def replay(recording):
+    # returns the first frame (counting from 1) where the state differs from the recording, or None if none do.
+    # raises ValueError if the map file has changed, since the recording can't be compared then
+    if recording["map_hash"] != map_hash(recording["map"]):
+        raise ValueError("map " + recording["map"] + " has changed since it was recorded")
+
+    checksums = array("I")
+    checksums.frombytes(base64.b64decode(recording["checksums"]))
+    if sys.byteorder != "little":
+        checksums.byteswap()
+
+    simulation = Simulation(recording["map"], recording["program"])
+    for checksum in checksums:
+        simulation.step()
+        if state_checksum(simulation) != checksum:
+            return simulation.character.total_frame
+    if simulation.map.win_frames != recording["win_frames"]:
+        return simulation.character.total_frame
+    return None
+
+
+def save_recording(file_path, recording):
+    with open(file_path, "w") as recording_file:
+        json.dump(recording, recording_file)
+
+
+def load_recording(file_path):
+    with open(file_path, "r") as recording_file:
+        recording = json.load(recording_file)
+    if recording.get("version") != RECORDING_VERSION:
+        raise ValueError("unsupported recording version: " + str(recording.get("version")))
+    return recording
+
+
+if __name__ == "__main__":
+    # usage: python replay.py record <map> <program file> <recording file> [max frames]
+    #        python replay.py check <recording file> [<recording file> ...]
+    if len(sys.argv) >= 5 and sys.argv[1] == "record":
+        program_file = open(sys.argv[3], "r")
+        code = program_file.read().strip("\n")
+        program_file.close()
+        max_frames = int(sys.argv[5]) if len(sys.argv) > 5 else 30 * 60 * 10
+        recording = record(sys.argv[2], code, max_frames)
+        save_recording(sys.argv[4], recording)
+        print("recorded", len(base64.b64decode(recording["checksums"])) // 4, "frames, win_frames:",
+              recording["win_frames"])
+    elif len(sys.argv) >= 3 and sys.argv[1] == "check":
+        failed = False
+        for file_path in sys.argv[2:]:
+            try:
+                frame = replay(load_recording(file_path))
+            except ValueError as error:
+                print(file_path + ":", error)
+                failed = True
+                continue
+            if frame is None:
+                print(file_path + ": ok")
+            else:
+                print(file_path + ": diverged at frame", frame)
+                failed = True
+        sys.exit(1 if failed else 0)
+    else:
+        print("usage: python replay.py record <map> <program file> <recording file> [max frames]\n"
+              "       python replay.py check <recording file> [<recording file> ...]")
+        sys.exit(2)
@@ -0,0 +1,55 @@
+import heapq
+
+# things that happen a number of frames after something else (attack hitboxes, the end of a jump), keyed on the
+# absolute frame they happen on. Events are kept in a heap, so scheduling one and taking it out when it's due are
+# both O(log n), and any number of events can wait for the same frame
+
+
+class Scheduler:
+    def __init__(self):
+        # (<frame>, <order scheduled>, <kind>, <value>), the next one due first. Events on the same frame come out
+        # in the order they were scheduled
+        self.events = []
+        self.order = 0
+        # kind -> latest frame an event of that kind was scheduled for
+        self.latest = {}
+
+    def __len__(self):
+        return len(self.events)
+
+    def clear(self):
+        self.events = []
+        self.order = 0
+        self.latest = {}
+
+    def schedule(self, frame, kind, value = None):
+        heapq.heappush(self.events, (frame, self.order, kind, value))
+        self.order += 1
+        if frame > self.latest.get(kind, frame - 1):
+            self.latest[kind] = frame
+
+    def due(self, frame):
+        # takes out every event due on or before frame, returns them as (<kind>, <value>)
+        events = []
+        while len(self.events) > 0 and self.events[0][0] <= frame:
+            event = heapq.heappop(self.events)
+            events.append((event[2], event[3]))
+        return events
+
+    def last(self, kind):
+        # latest frame an event of this kind was scheduled for (even if it has happened already), None if there's
+        # never been one
+        return self.latest.get(kind)
+
+    def pending(self, frame):
+        # events still to come as (<frames after frame>, <kind>, <value>), in the order they'll come out
+        return tuple((event[0] - frame, event[2], event[3]) for event in sorted(self.events))
+
+    def snapshot(self):
+        return tuple(self.events), self.order, tuple(self.latest.items())
+
+    def restore(self, state):
+        events, self.order, latest = state
+        # a copy of a heap is still a heap
+        self.events = list(events)
+        self.latest = dict(latest)
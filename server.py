@@ -0,0 +1,237 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from os import path
+from batch import BatchSimulation
+from program import assemble, parse_line
+
+# scores programs sent over a socket. Each line sent is a JSON request:
+#     {"id": <anything>, "map": <map name>, "program": <program text>, "frames": <max frames (optional)>}
+# and each line sent back answers one request, in the order they finish:
+#     {"id": ..., "win_frames": <frames>} or {"id": ..., "error": <reason>}
+# plus "warnings" with the lines that were left out of the program, if there were any (they're left out in the game
+# too). Requests wait in a bounded queue, and are taken from it in batches that are run by a pool of worker
+# processes with batch.BatchSimulation. Once the queue is full the server stops reading requests until there is
+# room, so clients sending too much are slowed down instead of using up memory. A request line longer than
+# REQUEST_LIMIT bytes is skipped and answered with {"id": null, "error": "request too long"}
+MAPS_DIR = path.join(".", "maps")
+MAX_FRAMES = 30 * 60 * 10
+# longest request line in bytes (asyncio's default is 64 KiB, about a 6000 line program)
+REQUEST_LIMIT = 1024 * 1024
+
+
+def evaluate(map_name, programs, max_frames):
+    # runs in a worker process. Returns a response (without the id) for each program
+    if map_name not in os.listdir(MAPS_DIR):
+        return [{"error": "unknown map: " + map_name}] * len(programs)
+    win_frames = BatchSimulation(map_name, programs).run(max_frames)
+
+    responses = []
+    for code, frames in zip(programs, win_frames):
+        if frames > 0:
+            response = {"win_frames": int(frames)}
+        else:
+            response = {"error": "not every target was broken within " + str(max_frames) + " frames"}
+        errors = assemble([parse_line(line) for line in code.split("\n")])[1]
+        if len(errors) > 0:
+            response["warnings"] = ["Error at line {}: {}".format(line_number, error) for line_number, error in errors]
+        responses.append(response)
+    return responses
+
+
+class Job:
+    def __init__(self, map_name, program, frames):
+        self.map_name = map_name
+        self.program = program
+        self.frames = frames
+        # set to the response once the program has been run
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class EvaluationServer:
+    def __init__(self, workers = None, queue_size = 1000, batch_size = 256, batch_delay = 0.01,
+                 max_frames = MAX_FRAMES, request_limit = REQUEST_LIMIT):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        # most programs run together in one batch, and how long to wait for more to fill a batch (seconds)
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        # most frames a request can ask for
+        self.max_frames = max_frames
+        # longest request line in bytes
+        self.request_limit = request_limit
+
+        self.pool = None
+        self.queue = None
+        # one per worker, so batches only leave the queue when a worker is free to run them
+        self.slots = None
+        # batches being run. asyncio only keeps weak references to tasks, so they're kept here until they finish
+        self.batches = set()
+
+    async def serve(self, host = "127.0.0.1", port = 8765, unix_path = None):
+        self.queue = asyncio.Queue(self.queue_size)
+        self.slots = asyncio.Semaphore(self.workers)
+        # workers are started as new processes instead of forked, since a worker forked while a client is connected
+        # would keep that client's socket open after the server closes it
+        with ProcessPoolExecutor(self.workers, mp_context = multiprocessing.get_context("spawn")) as self.pool:
+            if unix_path is not None:
+                server = await asyncio.start_unix_server(self._handle_client, unix_path, limit = self.request_limit)
+            else:
+                server = await asyncio.start_server(self._handle_client, host, port, limit = self.request_limit)
+            batcher = asyncio.create_task(self._batch_jobs())
+            try:
+                async with server:
+                    await server.serve_forever()
+            finally:
+                batcher.cancel()
+
+    async def _handle_client(self, reader, writer):
+        write_lock = asyncio.Lock()
+        responses = []
+        try:
+            while True:
+                line = await self._read_line(reader)
+                # stops reading from this client once answering it has failed
+                responses = self._pending(responses)
+                if line is None:
+                    await self._respond(writer, write_lock, dict(id = None, error = "request too long"))
+                    continue
+                if line == b"":
+                    break
+                if line.strip() == b"":
+                    continue
+                request_id, job, error = self._parse_request(line)
+                if job is None:
+                    await self._respond(writer, write_lock, dict(id = request_id, error = error))
+                    continue
+                # waits here while the queue is full, which stops reading from this client
+                await self.queue.put(job)
+                responses.append(asyncio.create_task(self._respond_when_done(writer, write_lock, request_id, job)))
+            # answer everything already sent before closing
+            await asyncio.gather(*responses)
+        except ConnectionError:
+            # the client is gone, so the rest can't be answered. Their exceptions are collected so asyncio doesn't
+            # log them as never retrieved
+            for response in responses:
+                response.cancel()
+            await asyncio.gather(*responses, return_exceptions = True)
+        finally:
+            writer.close()
+
+    def _pending(self, responses):
+        # the responses not sent yet. Raises the exception of any that failed, like a ConnectionError from writing
+        for response in responses:
+            if response.done() and not response.cancelled() and response.exception() is not None:
+                raise response.exception()
+        return [response for response in responses if not response.done()]
+
+    async def _read_line(self, reader):
+        # like reader.readline(), but a line longer than the limit is read to its end and thrown away, giving None,
+        # so the next request is read from the start of its line
+        too_long = False
+        while True:
+            try:
+                line = await reader.readuntil(b"\n")
+            except asyncio.IncompleteReadError as error:
+                # the connection closed, this is what was left (b"" if nothing)
+                line = error.partial
+            except asyncio.LimitOverrunError as error:
+                # throw away what has arrived of the line, up to the newline if it has arrived
+                too_long = True
+                await reader.readexactly(error.consumed)
+                continue
+            return None if too_long else line
+
+    def _parse_request(self, line):
+        # returns (<id>, <Job or None>, <error if there's no job>)
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return None, None, "invalid request: not JSON"
+        if type(request) != dict:
+            return None, None, "invalid request: not a JSON object"
+        request_id = request.get("id")
+        if type(request.get("map")) != str or type(request.get("program")) != str:
+            return request_id, None, "invalid request: needs \"map\" and \"program\" strings"
+        frames = request.get("frames", self.max_frames)
+        if type(frames) != int or frames <= 0:
+            return request_id, None, "invalid request: \"frames\" must be a positive whole number"
+        return request_id, Job(request["map"], request["program"], min(frames, self.max_frames)), None
+
+    async def _respond_when_done(self, writer, write_lock, request_id, job):
+        response = await job.future
+        await self._respond(writer, write_lock, dict(id = request_id, **response))
+
+    async def _respond(self, writer, write_lock, response):
+        async with write_lock:
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+
+    async def _batch_jobs(self):
+        while True:
+            # wait for a worker to be free, then for a job, then a moment longer for more jobs to batch with it
+            await self.slots.acquire()
+            jobs = [await self.queue.get()]
+            await asyncio.sleep(self.batch_delay)
+            while len(jobs) < self.batch_size and not self.queue.empty():
+                jobs.append(self.queue.get_nowait())
+
+            # programs only run together on the same map for the same number of frames
+            groups = {}
+            for job in jobs:
+                groups.setdefault((job.map_name, job.frames), []).append(job)
+            for index, ((map_name, frames), group) in enumerate(groups.items()):
+                if index > 0:
+                    await self.slots.acquire()
+                batch = asyncio.create_task(self._run_batch(map_name, frames, group))
+                self.batches.add(batch)
+                batch.add_done_callback(self.batches.discard)
+
+    async def _run_batch(self, map_name, frames, jobs):
+        try:
+            responses, error = await self._evaluate(map_name, [job.program for job in jobs], frames)
+            if error is not None and len(jobs) > 1:
+                # one program can fail the whole batch, so each one is run again on its own and only the ones that
+                # fail by themselves get an error
+                responses = []
+                for job in jobs:
+                    response, job_error = await self._evaluate(map_name, [job.program], frames)
+                    responses += response or [{"error": "evaluation failed: " + repr(job_error)}]
+            elif error is not None:
+                responses = [{"error": "evaluation failed: " + repr(error)}]
+        finally:
+            self.slots.release()
+        for job, response in zip(jobs, responses):
+            if not job.future.done():
+                job.future.set_result(response)
+
+    async def _evaluate(self, map_name, programs, frames):
+        # (<a response for each program>, None), or (None, <exception>) if running them failed
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.pool, evaluate, map_name, programs, frames), None
+        except Exception as error:
+            return None, error
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "score programs sent as JSON lines over a socket")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8765)
+    parser.add_argument("--unix", help = "listen on this unix socket instead of TCP")
+    parser.add_argument("--workers", type = int, default = None, help = "worker processes (default: one per core)")
+    parser.add_argument("--queue", type = int, default = 1000, help = "most requests waiting to be run")
+    parser.add_argument("--batch", type = int, default = 256, help = "most programs run together")
+    parser.add_argument("--frames", type = int, default = MAX_FRAMES, help = "most frames a program may run for")
+    parser.add_argument("--limit", type = int, default = REQUEST_LIMIT, help = "longest request line in bytes")
+    args = parser.parse_args()
+
+    server = EvaluationServer(args.workers, args.queue, args.batch, max_frames = args.frames,
+                              request_limit = args.limit)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,62 @@
+import sys
+from character import Character
+from checkpoints import Checkpoints
+from map import Map
+from program import compile_program, Executor
+
+
+class Simulation:
+    # runs a program on a map with the game's physics, hitboxes and targets but without a display.
+    # the map and character are headless so no fonts or images are loaded, and frames run as fast as possible
+    def __init__(self, map_name, code):
+        self.map = Map(map_name, headless = True)
+        self.character = Character(self.map, headless = True)
+        self.code = code
+        self.checkpoints = Checkpoints(self.character)
+        self.reset()
+
+    def reset(self):
+        # same as pressing play in the editor
+        self.character.spawn()
+        self.map.reset_map()
+        self.map.done = False
+        self.character.program = Executor(compile_program(self.code))
+        self.checkpoints.clear()
+
+    def step(self):
+        self.checkpoints.step()
+
+    def seek(self, frame):
+        # go to any frame of the run, see checkpoints.py
+        self.checkpoints.seek(frame)
+
+    def run(self, max_frames):
+        # returns win_frames, or 0 if the targets weren't all broken within max_frames
+        while not self.map.done and self.character.total_frame < max_frames:
+            self.step()
+        # like the game, win_frames is recorded on the frame after the last target breaks
+        if self.map.done and self.map.win_frames == 0:
+            self.step()
+        return self.map.win_frames
+
+    def state(self):
+        return {
+            "pos": self.character.pos[:],
+            "velocity": self.character.velocity[:],
+            "grounded": self.character.grounded,
+            "facing": self.character.facing,
+            "total_frame": self.character.total_frame,
+            "targets": len(self.map.targets),
+            "done": self.map.done,
+            "win_frames": self.map.win_frames
+        }
+
+
+if __name__ == "__main__":
+    # usage: python simulation.py <map> <program file> [max frames]
+    program_file = open(sys.argv[2], "r")
+    simulation = Simulation(sys.argv[1], program_file.read().strip("\n"))
+    program_file.close()
+    max_frames = int(sys.argv[3]) if len(sys.argv) > 3 else 30 * 60 * 10
+    print(simulation.run(max_frames))
+    print(simulation.state())
@@ -0,0 +1,121 @@
+import argparse
+import math
+import os
+import time
+from multiprocessing import Pool
+from map import Map
+from simulation import Simulation
+
+# searches for the program that breaks every target in the fewest frames.
+# programs are built one step at a time (a command followed by a wait), keeping the most promising ones at each
+# depth (beam search). Candidates are run by a pool of worker processes, and candidates that end up in a state
+# that another program already reached as fast or faster are dropped
+COMMANDS = ["MOVE LEFT", "MOVE RIGHT", "STOP", "JUMP", "ATTACK LEFT", "ATTACK RIGHT", "ATTACK UP"]
+WAITS = [0, 4, 10, 20]
+
+# each worker keeps one simulation per map and resets it for every candidate
+worker_simulations = {}
+
+
+def evaluate(job):
+    # runs a candidate until it wins, or until its program and any attacks it started have finished.
+    # returns (<code>, <win_frames>, <frames run>, <state key>, <score>)
+    map_name, code, frame_limit = job
+    if map_name not in worker_simulations:
+        worker_simulations[map_name] = Simulation(map_name, "")
+    simulation = worker_simulations[map_name]
+    simulation.code = code
+    simulation.reset()
+    character = simulation.character
+
+    while not simulation.map.done and character.total_frame < frame_limit:
+        if character.program.finished() and len(character.scheduler) == 0:
+            break
+        simulation.step()
+    # like the game, win_frames is recorded on the frame after the last target breaks
+    if simulation.map.done:
+        simulation.step()
+        return code, simulation.map.win_frames, character.total_frame, None, None
+
+    # everything that changes how the rest of a run would play out
+    state_key = (tuple(character.pos), tuple(character.velocity), character.grounded, character.facing,
+                 character.collided, character.scheduler.pending(character.total_frame), frozenset(simulation.map.targets))
+    # fewer targets left first, then closer to the nearest one, then fewer frames
+    centre = (character.pos[0] + character.size[0] / 2, character.pos[1] + character.size[1] / 2)
+    distance = min(math.hypot(simulation.map.render_offset[0] + (x + 0.5) * simulation.map.pixel_size[0] - centre[0],
+                              simulation.map.render_offset[1] + (y + 0.5) * simulation.map.pixel_size[1] - centre[1])
+                   for x, y in simulation.map.targets)
+    score = (len(simulation.map.targets), round(distance / simulation.map.pixel_size[0]), character.total_frame)
+    return code, 0, character.total_frame, state_key, score
+
+
+def children(code):
+    for command in COMMANDS:
+        for wait in WAITS:
+            step = command if wait == 0 else command + "\nWAIT " + str(wait)
+            yield step if code == "" else code + "\n" + step
+
+
+def solve(map_name, time_budget = 60, node_budget = 1000000, workers = None, beam_width = 100, frame_limit = 3000):
+    # returns (<win_frames>, <program>) of the fastest program found (None if nothing won) and the number of
+    # candidates evaluated
+    # a map without targets is never won, and evaluate() needs a target to score candidates by
+    if len(Map(map_name, headless = True).all_targets) == 0:
+        return None, 0
+    workers = workers or os.cpu_count() or 1
+    start_time = time.perf_counter()
+    best = None
+    # state key -> fewest frames it was reached in
+    seen = {}
+    frontier = [""]
+    nodes = 0
+
+    with Pool(workers) as pool:
+        while len(frontier) > 0 and nodes < node_budget and time.perf_counter() - start_time < time_budget:
+            jobs = [(map_name, child, frame_limit) for parent in frontier for child in children(parent)]
+            jobs = jobs[:node_budget - nodes]
+            next_frontier = []
+            for code, win_frames, frames, state_key, score in pool.imap(evaluate, jobs,
+                                                                          chunksize = max(1, len(jobs) // (workers * 4))):
+                nodes += 1
+                if win_frames > 0:
+                    if best is None or win_frames < best[0]:
+                        best = (win_frames, code)
+                    continue
+                # can't beat the best program found so far
+                if best is not None and frames >= best[0]:
+                    continue
+                if state_key in seen and seen[state_key] <= frames:
+                    continue
+                seen[state_key] = frames
+                next_frontier.append((score, code))
+                if time.perf_counter() - start_time >= time_budget:
+                    break
+
+            next_frontier.sort()
+            frontier = [code for score, code in next_frontier[:beam_width]]
+
+    return best, nodes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "search for the program that beats a map in the fewest frames")
+    parser.add_argument("map")
+    parser.add_argument("--time", type = float, default = 60, help = "time budget in seconds")
+    parser.add_argument("--nodes", type = int, default = 1000000, help = "number of candidate programs to try")
+    parser.add_argument("--workers", type = int, default = None, help = "worker processes (default: one per core)")
+    parser.add_argument("--beam", type = int, default = 100, help = "programs kept at each step")
+    parser.add_argument("--frames", type = int, default = 3000, help = "frames a candidate may run for")
+    parser.add_argument("--output", help = "write the best program to this file")
+    args = parser.parse_args()
+
+    best, nodes = solve(args.map, args.time, args.nodes, args.workers, args.beam, args.frames)
+    print("tried", nodes, "programs")
+    if best is None:
+        print("no program found that breaks every target")
+    else:
+        print("win_frames:", best[0])
+        print(best[1])
+        if args.output:
+            with open(args.output, "w") as output_file:
+                output_file.write(best[1] + "\n")
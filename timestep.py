@@ -0,0 +1,62 @@
+import time
+
+# the game simulates TICK_RATE ticks per second however often frames are drawn, so a slow frame doesn't slow the
+# game down. Every tick is the same Character.step() whatever the speed, so turbo and fast forward give exactly the
+# same win_frames as normal speed, just sooner
+TICK_RATE = 30
+
+
+class FixedTimestep:
+    def __init__(self, step, frame, tick_rate = TICK_RATE, max_ticks = 4):
+        # step runs one tick, frame returns the current frame number (Character.total_frame)
+        self.step = step
+        self.frame = frame
+        self.tick_rate = tick_rate
+        # most ticks run for one drawn frame at normal speed, so after a stall the game doesn't try to catch up
+        # all at once (and stall again)
+        self.max_ticks = max_ticks
+
+        # ticks run per tick of game time, 1 for normal speed
+        self.turbo = 1
+        # while fast forwarding ticks run as fast as possible with nothing drawn, until this frame is reached
+        self.target_frame = None
+        # longest a fast forward runs before letting a frame be drawn (and input be read), in seconds
+        self.fast_forward_budget = 0.25
+
+        # ticks owed but not run yet, as a fraction of a tick
+        self.accumulator = 0.0
+        self.last_time = time.perf_counter()
+
+    def fast_forward(self, target_frame):
+        self.target_frame = target_frame
+
+    def stop_fast_forward(self):
+        self.target_frame = None
+        # don't make up for the time spent fast forwarding
+        self.accumulator = 0.0
+        self.last_time = time.perf_counter()
+
+    def update(self):
+        # runs the ticks due since the last update, returns how many were run
+        now = time.perf_counter()
+        elapsed = now - self.last_time
+        self.last_time = now
+
+        if self.target_frame is not None:
+            ticks = 0
+            while self.frame() < self.target_frame and time.perf_counter() - now < self.fast_forward_budget:
+                self.step()
+                ticks += 1
+            if self.frame() >= self.target_frame:
+                self.stop_fast_forward()
+            return ticks
+
+        self.accumulator = min(self.accumulator + elapsed * self.tick_rate * self.turbo, self.max_ticks * self.turbo)
+        ticks = int(self.accumulator)
+        self.accumulator -= ticks
+        for tick in range(ticks):
+            self.step()
+        return ticks
+
+    def fast_forwarding(self):
+        return self.target_frame is not None